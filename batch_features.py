@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from keystroke_features import participant_features, read_keystrokes
+
+# 実験で集めた keyboard_data.csv (app.py / app_test.py、参加者・条件ごとに1ファイル) をまとめて読み込み、
+# 検証して参加者 × 条件ごとの特徴量表 (keystroke_features.participant_features) を1つ書き出す。
+#
+#   data/<参加者>/<条件>/keyboard_data.csv     (.csv.gz / .kbin / .kbin.gz も可。条件のディレクトリは省略可)
+#
+#   python batch_features.py data --output features.csv --workers 8
+#
+# ファイルごとの処理はプロセスプールで並列に行う (ファイル間に依存がないのでコア数に比例して速くなる)。
+# 処理済みのファイルは結果ごと <output>.progress.jsonl に1行ずつ追記するので、中断しても再実行すれば
+# 未処理のファイル (または更新されたファイル) だけを処理する。検証に失敗したファイルは理由を記録して飛ばす。
+
+DATA_FILES = ("keyboard_data.csv", "keyboard_data.csv.gz", "keyboard_data.kbin", "keyboard_data.kbin.gz")
+
+
+def discover(roots):
+    # roots の下にある打鍵記録のファイル (同じディレクトリに複数の形式があれば DATA_FILES の先のものだけ)
+    found = {}
+    for root in roots:
+        root = Path(root)
+        for name in DATA_FILES:
+            for path in sorted(root.rglob(name)):
+                found.setdefault(path.parent, (root, path))
+    return [found[d] for d in sorted(found)]
+
+
+def file_key(path):
+    # 中断後の再実行で「処理済み」とみなす条件 (パス・大きさ・更新時刻が同じ)
+    stat = os.stat(path)
+    return {"path": str(path), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def labels(root, path):
+    # ディレクトリ構成から参加者と条件を決める (root 直下のディレクトリが参加者、その下が条件)
+    parts = path.parent.relative_to(root).parts
+    if not parts:
+        raise ValueError(f"{path}: expected <participant>/[<condition>/]{path.name} under {root}")
+    return parts[0], "/".join(parts[1:])
+
+
+def validate(table, path):
+    # 読み込んだ表が実験の記録として使えるか (問題があれば ValueError)
+    n = len(table["trial"])
+    if n == 0:
+        raise ValueError(f"{path}: no keystrokes")
+    trial = table["trial"]
+    if trial.min() < 1 or np.any(np.diff(trial) < 0):
+        raise ValueError(f"{path}: trial numbers are not positive and non-decreasing")
+    hold = table["hold"]
+    if np.any(hold[np.isfinite(hold)] < 0):
+        raise ValueError(f"{path}: negative hold times")
+    if np.any(~np.isfinite(table["down_down"])):
+        raise ValueError(f"{path}: missing DownDown values")
+
+
+def process_file(root, path):
+    # 1ファイル分 (プロセスプールの各ワーカーで実行する)。結果は JSON に書ける dict
+    participant, condition = labels(root, path)
+    table = read_keystrokes(path)
+    validate(table, path)
+    features = participant_features(table).drop(columns="participant").to_dict(orient="records")[0]
+    return {"participant": participant, "condition": condition, **features}
+
+
+def _run(root, path):
+    key = file_key(path)
+    try:
+        return {**key, "status": "ok", "row": process_file(root, path)}
+    except (ValueError, KeyError, OSError, pd.errors.ParserError) as e:
+        return {**key, "status": "error", "error": str(e)}
+
+
+def read_progress(progress_path):
+    # 処理済みのファイル (パス → 最後の結果)。書き込み途中で止まった最後の行は無視する
+    done = {}
+    if not progress_path.exists():
+        return done
+    with open(progress_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            done[result["path"]] = result
+    return done
+
+
+def is_done(result, path):
+    return result is not None and {k: result[k] for k in ("path", "size", "mtime")} == file_key(path)
+
+
+def write_table(results, output):
+    rows = [r["row"] for r in results if r["status"] == "ok"]
+    table = pd.DataFrame(rows)
+    if rows:
+        table = table.sort_values(["participant", "condition"], kind="stable").reset_index(drop=True)
+    table.to_csv(output, index=False)
+    return table
+
+
+def run(roots, output, workers=None, progress=sys.stderr):
+    output = Path(output)
+    progress_path = output.with_name(output.name + ".progress.jsonl")
+    files = discover(roots)
+    done = read_progress(progress_path)
+    pending = [(root, path) for root, path in files if not is_done(done.get(str(path)), path)]
+    print(f"{len(files)} files, {len(files) - len(pending)} already processed, {len(pending)} to process", file=progress)
+
+    start = time.perf_counter()
+    with open(progress_path, "a", encoding="utf-8") as log, ProcessPoolExecutor(max_workers=workers) as pool:
+        if log.tell() > 0 and not progress_path.read_bytes().endswith(b"\n"):
+            log.write("\n") # 前回途中で止まった行の続きに書かない
+        futures = [pool.submit(_run, root, path) for root, path in pending]
+        for i, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            log.write(json.dumps(result, ensure_ascii=False) + "\n")
+            log.flush()
+            done[result["path"]] = result
+            elapsed = time.perf_counter() - start
+            eta = elapsed / i * (len(pending) - i)
+            status = "ok" if result["status"] == "ok" else f"ERROR {result['error']}"
+            print(f"[{i}/{len(pending)}] {result['path']} {status} ({i / elapsed:.1f} files/s, ETA {eta:.0f}s)", file=progress)
+
+    # 見つかったファイルの最新の結果だけで表を作る (消えたファイルの古い結果は含めない)
+    results = [done[str(path)] for _, path in files if str(path) in done]
+    errors = [r for r in results if r["status"] != "ok"]
+    table = write_table(results, output)
+    print(f"{output}: {len(table)} rows, {len(errors)} files failed validation", file=progress)
+    return table, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="keyboard_data.csv をまとめて検証し、参加者ごとの特徴量表を書き出す")
+    parser.add_argument("roots", nargs="+", type=Path, help="参加者ごとのディレクトリを含むディレクトリ")
+    parser.add_argument("--output", type=Path, default=Path("features.csv"), help="特徴量表 (CSV) の書き出し先")
+    parser.add_argument("--workers", type=int, default=None, help="並列プロセス数 (既定: CPU コア数)")
+    args = parser.parse_args(argv)
+
+    _, errors = run(args.roots, args.output, workers=args.workers)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import numpy as np
+import streamlit as st
+from streamlit import logger
+from streamlit.testing.v1 import AppTest
+
+# キャッシュや ScriptRunContext の警告で結果が読みにくくなるので抑える
+st.config.set_option("logger.level", "error")
+logger.set_log_level("error")
+
+import keyboard_page  # noqa: E402
+
+# Streamlit の描画経路 (main() の再実行・ページ生成) のベンチマーク。
+#
+#   python benchmarks/bench_render.py                         # 計測して baseline.json と比較
+#   python benchmarks/bench_render.py --output result.json    # 結果を JSON で保存
+#   python benchmarks/bench_render.py --update-baseline       # 現在の結果を基準値にする
+#
+# 時間は計測するマシンに依存するので、基準値は実験で使うマシンで作り直すこと。
+# 基準値より --tolerance 倍以上遅い (バイト数は1バイトでも大きい) 項目があれば終了コード 1 を返す。
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+ENTRY_POINTS = ["app.py", "app_test.py"]
+PATTERNS = {"random": "ランダム", "ordered": "規則的 (順序指定)"}
+ENGINES = {"css": "CSS keyframes", "script": "スクリプト (長時間向け)"}
+# (再生方式, サイクル数)。CSS 方式ではサイクル数は 20 固定
+MOTION_CASES = [("css", 20), ("script", 20), ("script", 200), ("script", 2000)]
+MOVE_RANGES = [0, 30, 200]
+# これより小さい差はタイマーの揺らぎとして回帰に数えない
+MIN_DELTA_MS = 1.0
+
+
+def _widget(widgets, label):
+    return next(w for w in widgets if w.label == label)
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q))
+
+
+def _configure(at, pattern, engine, cycle_count, move_range):
+    _widget(at.radio, "移動順序モード").set_value(PATTERNS[pattern])
+    _widget(at.radio, "移動アニメーションの再生方式").set_value(ENGINES[engine])
+    _widget(at.slider, "移動範囲 (px)").set_value(move_range)
+    at.run()
+    if engine == "script":
+        _widget(at.number_input, "サイクル数 (8方向 × N)").set_value(cycle_count)
+
+
+def _component_args(at):
+    # ブラウザへ送られるコンポーネント引数 (設定 JSON と ack) のバイト数
+    for element in at.main:
+        if getattr(element, "type", None) == "component_instance":
+            return len(element.proto.json_args.encode("utf-8"))
+    return None
+
+
+def bench_render(entry, pattern, engine, cycle_count, move_range, repeat):
+    at = AppTest.from_file(str(ROOT / entry), default_timeout=60).run()
+    _configure(at, pattern, engine, cycle_count, move_range)
+
+    # cold: 移動パスのキャッシュが無い状態での再実行、warm: 同じ設定での再実行
+    st.cache_data.clear()
+    start = time.perf_counter()
+    at.run()
+    cold_ms = (time.perf_counter() - start) * 1000
+    if at.exception:
+        raise RuntimeError(f"{entry}: {at.exception}")
+
+    warm = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        at.run()
+        warm.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "name": f"{entry}/{pattern}/{engine}/cycles={cycle_count}/range={move_range}",
+        "cold_ms": round(cold_ms, 3),
+        "warm_median_ms": round(statistics.median(warm), 3),
+        "warm_p90_ms": round(_percentile(warm, 90), 3),
+        "args_bytes": _component_args(at),
+    }
+
+
+def bench_path(pattern, cycle_count, repeat):
+    # 移動パス生成 (キャッシュを通さない本体) の時間
+    user_order = tuple(keyboard_page.DIR_VECTORS.values())
+    build = keyboard_page.build_motion.__wrapped__
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        dirs = build(PATTERNS[pattern], 42, user_order, cycle_count)
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        "name": f"path/{pattern}/cycles={cycle_count}",
+        "median_ms": round(statistics.median(times), 3),
+        "dirs_bytes": len(dirs),
+    }
+
+
+def bench_template(repeat):
+    # 静的テンプレートの組み立て (プロセスごとに1回) の時間と大きさ
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        html = keyboard_page.load_template.__wrapped__()
+        times.append((time.perf_counter() - start) * 1000)
+    return {"name": "template", "median_ms": round(statistics.median(times), 3), "html_bytes": len(html.encode("utf-8"))}
+
+
+def run_suite(repeat, quick=False):
+    motion_cases = MOTION_CASES[:2] if quick else MOTION_CASES
+    move_ranges = MOVE_RANGES[1:2] if quick else MOVE_RANGES
+    results = [bench_template(repeat)]
+    for pattern in PATTERNS:
+        for cycle_count in sorted({c for _, c in motion_cases} | {10000}):
+            results.append(bench_path(pattern, cycle_count, repeat))
+    for entry in ENTRY_POINTS:
+        for pattern in PATTERNS:
+            for engine, cycle_count in motion_cases:
+                for move_range in move_ranges:
+                    results.append(bench_render(entry, pattern, engine, cycle_count, move_range, repeat))
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "streamlit": st.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "system": platform.system(),
+        },
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    # 基準値と比べて遅く (大きく) なった項目の一覧
+    base = {r["name"]: r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        reference = base.get(result["name"])
+        if reference is None:
+            continue
+        for metric, value in result.items():
+            old = reference.get(metric)
+            if metric == "name" or value is None or old is None:
+                continue
+            limit = max(old * tolerance, old + MIN_DELTA_MS) if metric.endswith("_ms") else old
+            if value > limit:
+                regressions.append({"name": result["name"], "metric": metric, "baseline": old, "value": value})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Streamlit の描画経路のベンチマーク")
+    parser.add_argument("--repeat", type=int, default=5, help="各項目の繰り返し回数")
+    parser.add_argument("--quick", action="store_true", help="掃引を減らして短時間で回す")
+    parser.add_argument("--output", type=Path, help="結果の JSON の保存先")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="結果を基準値として保存する")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="時間の許容倍率")
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.repeat, quick=args.quick)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    if args.update_baseline:
+        args.baseline.write_text(text + "\n", encoding="utf-8")
+        print(f"baseline updated: {args.baseline}")
+        return 0
+    if not args.output:
+        print(text)
+
+    if not args.baseline.exists():
+        return 0
+    regressions = compare(report, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+    for r in regressions:
+        print(f"REGRESSION {r['name']} {r['metric']}: {r['baseline']} -> {r['value']}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,319 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+import streamlit as st
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from bench_render import ENGINES, PATTERNS, ROOT, _percentile
+import trial_model  # noqa: E402  (bench_render がリポジトリ直下を sys.path に加える)
+
+# 1つの Streamlit サーバーに N 台分のセッションが同時につながったときの負荷試験。
+#
+#   pip install websockets                                           # WebSocket クライアント (streamlit の依存には含まれない)
+#   python benchmarks/load_test.py                                   # サーバーを起動して 1〜40 セッションで各 10 秒
+#   python benchmarks/load_test.py --sessions 10 30 --duration 30 --output load.json
+#   python benchmarks/load_test.py --url http://localhost:8601       # 起動済みのサーバー (serve_workers.py のワーカーの1つなど) を試す
+#
+# 接続は全て同じ IP から来るので、nginx の前段に向けると IP ハッシュで1つのワーカーにしか届かない。
+#
+# 各セッションはブラウザと同じ WebSocket (/_stcore/stream) でつながり、待ち時間なしに再実行を繰り返す。
+# 再実行の大半は試行の記録 (trial_model の合成セッション) をコンポーネントの値として送って保存・ack を受け取るもので、
+# 一部 (--settings-ratio) はサイドバーの設定変更。セッションごとに初期設定を変えてキャッシュを分散させる。
+# 再実行の待ち時間の分布・全体のスループット・サーバープロセスの常駐メモリを記録する。
+
+SESSION_COUNTS = [1, 5, 10, 20, 40]
+CYCLE_COUNTS = [20, 200, 2000]
+MOVE_RANGES = [0, 30, 200]
+
+
+def _rss_bytes(pid):
+    # プロセスの常駐メモリ (Linux は /proc、それ以外は ps)
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        out = subprocess.run(["ps", "-o", "rss=", "-p", str(pid)], capture_output=True, text=True).stdout
+        return int(out.strip()) * 1024 if out.strip() else None
+
+
+def start_server(entry, port, data_dir):
+    env = dict(os.environ, KB_DATA_DIR=str(data_dir))
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "streamlit", "run", str(ROOT / entry),
+            "--server.headless", "true",
+            "--server.port", str(port),
+            "--server.fileWatcherType", "none",
+            "--browser.gatherUsageStats", "false",
+        ],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as res:
+                if res.status == 200:
+                    return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"streamlit did not start on port {port}")
+
+
+class LoadSession:
+    # タブレット1台分: 設定の異なるセッションで試行を1つずつ送り、ときどき設定を変える
+    def __init__(self, index, settings_ratio):
+        self.rng = np.random.default_rng(index)
+        self.session_id = f"loadtest-{os.getpid()}-{index:04d}"
+        self.settings_ratio = settings_ratio
+        self.columns = trial_model.generate_session(seed=index, n_trials=100)
+        trials = self.columns["trial"]
+        self.bounds = np.flatnonzero(np.r_[True, trials[1:] != trials[:-1], True])
+        self.seq = 0
+        self.batches = []
+        self.widgets = {}  # ラベル → ウィジェット ID (再実行の出力から拾う)
+        self.states = {}   # ウィジェット ID → WidgetState (ブラウザと同じく毎回すべて送る)
+        self.latencies = []
+        self.ws = None
+
+    def _choice(self, values):
+        return values[self.rng.integers(len(values))]
+
+    async def connect(self, ws_url):
+        self.ws = await websockets.connect(ws_url, subprotocols=["streamlit"], max_size=None)
+        await self.rerun()
+        # 初期設定 (順序モード・再生方式で表示されるウィジェットが変わるので2回に分けて再実行する)
+        self._set("移動順序モード", string_value=self._choice(list(PATTERNS.values())))
+        self._set("移動アニメーションの再生方式", string_value=self._choice(list(ENGINES.values())))
+        self._set("移動範囲 (px)", double_array_value=[float(self._choice(MOVE_RANGES))])
+        await self.rerun()
+        if "サイクル数 (8方向 × N)" in self.widgets:
+            self._set("サイクル数 (8方向 × N)", double_value=float(self._choice(CYCLE_COUNTS)))
+        if "乱数シード (Seed)" in self.widgets:
+            self._set("乱数シード (Seed)", double_value=float(self.rng.integers(1000)))
+        await self.rerun()
+
+    async def close(self):
+        await self.ws.close()
+
+    def _set(self, label, **value):
+        widget_id = self.widgets[label]
+        state = WidgetState(id=widget_id)
+        for field, v in value.items():
+            if field == "double_array_value":
+                state.double_array_value.data.extend(v)
+            else:
+                setattr(state, field, v)
+        self.states[widget_id] = state
+
+    async def rerun(self):
+        # 再実行を要求し、script_finished までの出力を読む。コンポーネント引数の ack を返す
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = ""
+        msg.rerun_script.widget_states.widgets.extend(self.states.values())
+        await self.ws.send(msg.SerializeToString())
+        ack = None
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(await self.ws.recv())
+            kind = fwd.WhichOneof("type")
+            if kind == "script_finished":
+                return ack
+            if kind != "delta" or fwd.delta.WhichOneof("type") != "new_element":
+                continue
+            element = fwd.delta.new_element
+            element_type = element.WhichOneof("type")
+            if element_type == "exception":
+                raise RuntimeError(f"{self.session_id}: {element.exception.message}")
+            widget = getattr(element, element_type)
+            if not getattr(widget, "id", ""):
+                continue
+            if element_type == "component_instance":
+                self.widgets["keyboard"] = widget.id
+                ack = json.loads(widget.json_args).get("ack")
+            else:
+                self.widgets[widget.label] = widget.id
+
+    def _next_trial(self):
+        # ブラウザと同じく、ack が返るまで未確認のバッチをまとめて送り直す。
+        # 合成セッションの試行を繰り返し使うので、試行番号はバッチの seq に付け替える
+        # (サーバーは seq と試行番号が違う行を保存しない)
+        n_trials = len(self.bounds) - 1
+        start, stop = self.bounds[self.seq % n_trials], self.bounds[self.seq % n_trials + 1]
+        self.seq += 1
+        records = trial_model.to_records(self.columns, start, stop)
+        for record in records:
+            record["trial"] = self.seq
+        self.batches.append({
+            "seq": self.seq,
+            "records": records,
+            "frames": None,
+            "motion": None,
+        })
+        self._set("keyboard", json_value=json.dumps({"session": self.session_id, "batches": self.batches}))
+
+    async def step(self):
+        if self.rng.random() < self.settings_ratio:
+            if self.rng.random() < 0.5:
+                self._set("移動範囲 (px)", double_array_value=[float(self._choice(MOVE_RANGES))])
+            else:
+                self._set("移動の速さ (秒/回)", double_array_value=[round(float(self.rng.uniform(0.5, 3.0)), 1)])
+        else:
+            self._next_trial()
+        start = time.perf_counter()
+        ack = await self.rerun()
+        self.latencies.append((time.perf_counter() - start) * 1000)
+        if ack:
+            self.batches = [b for b in self.batches if b["seq"] > ack["seq"]]
+
+
+async def run_level(ws_url, n_sessions, duration, settings_ratio, sessions, server_pid):
+    # sessions はレベルをまたいで使い回す (増えた分だけ接続する)。待ち時間なしで duration 秒回す
+    while len(sessions) < n_sessions:
+        session = LoadSession(len(sessions), settings_ratio)
+        await session.connect(ws_url)
+        sessions.append(session)
+    active = sessions[:n_sessions]
+    for session in active:
+        session.latencies = []
+
+    start = time.perf_counter()
+    deadline = start + duration
+
+    async def drive(session):
+        while time.perf_counter() < deadline:
+            await session.step()
+
+    await asyncio.gather(*(drive(s) for s in active))
+    elapsed = time.perf_counter() - start
+
+    latencies = [ms for s in active for ms in s.latencies]
+    rss = _rss_bytes(server_pid) if server_pid else None
+    return {
+        "sessions": n_sessions,
+        "reruns": len(latencies),
+        "throughput_per_s": round(len(latencies) / elapsed, 2),
+        "per_session_min_per_s": round(min(len(s.latencies) for s in active) / elapsed, 3),
+        "latency_p50_ms": round(_percentile(latencies, 50), 3),
+        "latency_p90_ms": round(_percentile(latencies, 90), 3),
+        "latency_p99_ms": round(_percentile(latencies, 99), 3),
+        "latency_max_ms": round(max(latencies), 3),
+        "server_rss_mb": round(rss / 2**20, 1) if rss else None,
+    }
+
+
+def summarize(levels, idle_rss, trial_seconds, latency_budget_ms):
+    # 1プロセスの上限: 飽和時のスループットと、p90 が予算内に収まる最大のセッション数。
+    # セッションあたりのメモリは接続前 (起動直後の1回の再実行後) との差をセッション数で割る
+    last = levels[-1]
+    max_throughput = max(level["throughput_per_s"] for level in levels)
+    within_budget = [level["sessions"] for level in levels if level["latency_p90_ms"] <= latency_budget_ms]
+    rss_per_session = None
+    if idle_rss and last["server_rss_mb"]:
+        rss_per_session = round((last["server_rss_mb"] - idle_rss / 2**20) / last["sessions"], 2)
+    return {
+        "max_throughput_per_s": max_throughput,
+        "rss_per_session_mb": rss_per_session,
+        # 参加者1人は1試行 (trial_seconds 秒) ごとに1回再実行を起こす
+        "participants_at_saturation": int(max_throughput * trial_seconds),
+        "max_sessions_within_budget": max(within_budget) if within_budget else 0,
+        "latency_budget_ms": latency_budget_ms,
+        "trial_seconds": trial_seconds,
+    }
+
+
+async def run(args, ws_url, server_pid):
+    if server_pid:
+        # 起動直後の状態 (スクリプトを1回実行してキャッシュ・テンプレートが載った状態) を基準にする
+        warmup = LoadSession(0, 0.0)
+        await warmup.connect(ws_url)
+        await warmup.close()
+        await asyncio.sleep(1)
+    idle_rss = _rss_bytes(server_pid) if server_pid else None
+
+    sessions = []
+    levels = []
+    try:
+        for n_sessions in sorted(args.sessions):
+            level = await run_level(ws_url, n_sessions, args.duration, args.settings_ratio, sessions, server_pid)
+            levels.append(level)
+            rss = f"  RSS {level['server_rss_mb']:7.1f} MB" if level["server_rss_mb"] else ""
+            print(
+                f"{n_sessions:4d} sessions: {level['throughput_per_s']:8.1f} reruns/s  "
+                f"p50 {level['latency_p50_ms']:7.1f} ms  p90 {level['latency_p90_ms']:7.1f} ms  "
+                f"p99 {level['latency_p99_ms']:7.1f} ms{rss}",
+                file=sys.stderr,
+            )
+    finally:
+        await asyncio.gather(*(s.close() for s in sessions))
+    return levels, summarize(levels, idle_rss, args.trial_seconds, args.latency_budget)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Streamlit サーバーの同時セッション負荷試験")
+    parser.add_argument("--entry", default="app.py", choices=["app.py", "app_test.py"])
+    parser.add_argument("--url", help="起動済みのサーバーの URL (省略時は --port でサーバーを起動する)")
+    parser.add_argument("--port", type=int, default=8599, help="起動するサーバーのポート")
+    parser.add_argument("--sessions", type=int, nargs="+", default=SESSION_COUNTS, help="同時セッション数 (複数指定で掃引)")
+    parser.add_argument("--duration", type=float, default=10.0, help="各セッション数で回す秒数")
+    parser.add_argument("--settings-ratio", type=float, default=0.1, help="再実行のうち設定変更の割合")
+    parser.add_argument("--trial-seconds", type=float, default=4.0, help="参加者1人が1試行にかかる秒数 (収容人数の見積もり用)")
+    parser.add_argument("--latency-budget", type=float, default=200.0, help="再実行の p90 の許容値 (ms)")
+    parser.add_argument("--output", type=Path, help="結果の JSON の保存先")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="kb_load_") as data_dir:
+        server = None
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            server = start_server(args.entry, args.port, data_dir)
+            base_url = f"http://127.0.0.1:{args.port}"
+        ws_url = base_url.replace("http", "ws", 1) + "/_stcore/stream"
+        try:
+            levels, summary = asyncio.run(run(args, ws_url, server.pid if server else None))
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "streamlit": st.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "system": platform.system(),
+            "cpus": os.cpu_count(),
+        },
+        "entry": args.entry,
+        "url": args.url,
+        "duration_s": args.duration,
+        "settings_ratio": args.settings_ratio,
+        "levels": levels,
+        "summary": summary,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
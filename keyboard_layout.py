@@ -0,0 +1,95 @@
+# キーボードのキー配列と移動方向の定義 (ページ生成・サーバー保存・解析で共通。streamlit に依存しない)
+
+# 方向定義 (ラベル → 移動ベクトル)
+DIR_VECTORS = {
+    "上": (0, -1), "右上": (1, -1), "右": (1, 0), "右下": (1, 1),
+    "下": (0, 1), "左下": (-1, 1), "左": (-1, 0), "左上": (-1, -1)
+}
+
+# --- キーボードデータ定義 ---
+ROWS = [
+    # Row 1
+    [
+        {"label": "~", "sub": "`", "val": "`", "w": 1},
+        {"label": "!", "sub": "1 ぬ", "val": "1", "w": 1},
+        {"label": "@", "sub": "2 ふ", "val": "2", "w": 1},
+        {"label": "#", "sub": "3 あ", "val": "3", "w": 1},
+        {"label": "$", "sub": "4 う", "val": "4", "w": 1},
+        {"label": "%", "sub": "5 え", "val": "5", "w": 1},
+        {"label": "^", "sub": "6 お", "val": "6", "w": 1},
+        {"label": "&", "sub": "7 や", "val": "7", "w": 1},
+        {"label": "*", "sub": "8 ゆ", "val": "8", "w": 1},
+        {"label": "(", "sub": "9 よ", "val": "9", "w": 1},
+        {"label": ")", "sub": "0 わ", "val": "0", "w": 1},
+        {"label": "-", "sub": "ー", "val": "-", "w": 1,},
+        {"label": "+", "sub": "=", "val": "=", "w": 1},
+        {"label": "BS", "sub": "", "val": "BS", "w": 2,},
+    ],
+    # Row 2
+    [
+        {"label": "Tab", "sub": "", "val": "Tab", "w": 1.5, "align": "left"},
+        {"label": "Q", "sub": "た", "val": "q", "w": 1},
+        {"label": "W", "sub": "て", "val": "w", "w": 1},
+        {"label": "E", "sub": "い", "val": "e", "w": 1},
+        {"label": "R", "sub": "す", "val": "r", "w": 1,},
+        {"label": "T", "sub": "か", "val": "t", "w": 1},
+        {"label": "Y", "sub": "ん", "val": "y", "w": 1},
+        {"label": "U", "sub": "な", "val": "u", "w": 1},
+        {"label": "I", "sub": "に", "val": "i", "w": 1},
+        {"label": "O", "sub": "ら", "val": "o", "w": 1},
+        {"label": "P", "sub": "せ", "val": "p", "w": 1},
+        {"label": "{", "sub": "「", "val": "{", "w": 1,},
+        {"label": "}", "sub": "」", "val": "}", "w": 1,},
+        {"label": "|", "sub": "ー", "val": "|", "w": 1,},
+    ],
+    # Row 3
+    [
+        {"label": "Caps", "sub": "", "val": "Caps", "w": 1.8, "align": "left"},
+        {"label": "A", "sub": "ち", "val": "a", "w": 1},
+        {"label": "S", "sub": "と", "val": "s", "w": 1},
+        {"label": "D", "sub": "し", "val": "d", "w": 1,},
+        {"label": "F", "sub": "は", "val": "f", "w": 1,},
+        {"label": "G", "sub": "き", "val": "g", "w": 1},
+        {"label": "H", "sub": "く", "val": "h", "w": 1},
+        {"label": "J", "sub": "ま", "val": "j", "w": 1},
+        {"label": "K", "sub": "の", "val": "k", "w": 1},
+        {"label": "L", "sub": "り", "val": "l", "w": 1},
+        {"label": ":", "sub": ";", "val": ":", "w": 1},
+        {"label": "\"", "sub": "'", "val": "\"", "w": 1}, 
+        {"label": "Enter", "sub": "", "val": "Enter", "w": 2.2, "align": "right"},
+    ],
+    # Row 4
+    [
+        {"label": "Shift", "sub": "", "val": "LShift", "w": 2.3, "align": "left"}, # LShift
+        {"label": "Z", "sub": "つ", "val": "z", "w": 1},
+        {"label": "X", "sub": "さ", "val": "x", "w": 1},
+        {"label": "C", "sub": "そ", "val": "c", "w": 1},
+        {"label": "V", "sub": "ひ", "val": "v", "w": 1},
+        {"label": "B", "sub": "こ", "val": "b", "w": 1},
+        {"label": "N", "sub": "み", "val": "n", "w": 1},
+        {"label": "M", "sub": "も", "val": "m", "w": 1},
+        {"label": "<", "sub": "、", "val": "<", "w": 1},
+        {"label": ">", "sub": "。", "val": ">", "w": 1},
+        {"label": "?", "sub": "・", "val": "?", "w": 1},
+        {"label": "Shift", "sub": "", "val": "RShift", "w": 2.7, "align": "right"}, # RShift
+    ],
+    # Row 5
+    [
+        {"label": "Ctrl", "sub": "", "val": "LCtrl", "w": 1.5}, # LCtrl
+        {"label": "Fn", "sub": "", "val": "Fn", "w": 1},
+        {"label": "Win", "sub": "", "val": "LWin", "w": 1},   # LWin
+        {"label": "Alt", "sub": "", "val": "LAlt", "w": 1},   # LAlt
+        {"label": "", "sub": "", "val": "Space", "w": 5},
+        {"label": "Alt", "sub": "", "val": "RAlt", "w": 1},   # RAlt
+        {"label": "Win", "sub": "", "val": "RWin", "w": 1},   # RWin
+        {"label": "Ctrl", "sub": "", "val": "RCtrl", "w": 1}, # RCtrl
+        {"label": "←", "sub": "", "val": "Left", "w": 1},
+        {"label": "↑", "sub": "", "val": "Up", "w": 1},
+        {"label": "↓", "sub": "", "val": "Down", "w": 1},
+        {"label": "→", "sub": "", "val": "Right", "w": 1},
+    ]
+]
+
+# キーの値 (rows の val) → キーコード (rows を左上から順に数えた添字)
+KEY_VALUES = [key["val"] for row in ROWS for key in row]
+KEY_CODES = {val: i for i, val in enumerate(KEY_VALUES)}
@@ -0,0 +1,91 @@
+import json
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import streamlit as st
+import streamlit.components.v1 as components
+
+from keyboard_layout import DIR_VECTORS, ROWS
+from keystroke_schema import COLUMNS, FRAME_BUCKETS_MS
+from motion_path import DIR_INDEX, encode_path, motion_spec, path_from_spec
+from phrase_corpus import DEFAULT_PHRASES, ENTRY_CLASSES, corpus_payload, parse_corpus
+
+# app.py (訓練データ用) と app_test.py (テストデータ用) で共通のキーボードページ。
+# 静的な HTML/CSS/JS (keyboard_page.html) はプロセスごとに1回だけ組み立てて双方向コンポーネントとして配信し、
+# 再実行のたびには小さな設定 JSON と受領確認 (ack) だけを送る。
+
+TEMPLATE_PATH = Path(__file__).with_name("keyboard_page.html")
+
+
+def ease_in_out_table(n=64):
+    # CSS の ease-in-out (cubic-bezier(0.42, 0, 0.58, 1)) を進行度 x の等間隔で n 分割した値の表
+    x1, x2 = 0.42, 0.58
+    table = []
+    for i in range(n + 1):
+        x = i / n
+        lo, hi = 0.0, 1.0
+        for _ in range(40):
+            t = (lo + hi) / 2
+            bx = 3 * (1 - t) ** 2 * t * x1 + 3 * (1 - t) * t ** 2 * x2 + t ** 3
+            if bx < x:
+                lo = t
+            else:
+                hi = t
+        t = (lo + hi) / 2
+        table.append(round(3 * (1 - t) * t ** 2 + t ** 3, 6))
+    return table
+
+
+def motion_path_spec(move_pattern, random_seed, user_order, cycle_count):
+    # サイドバーの設定から、セッションと一緒に保存する移動パスの設定 (motion_path.motion_spec) を作る
+    if move_pattern == "ランダム":
+        return motion_spec(seed=random_seed, cycle_count=cycle_count)
+    return motion_spec(order=[DIR_INDEX[vec] for vec in user_order], cycle_count=cycle_count)
+
+
+@st.cache_data(show_spinner=False)
+def build_motion(move_pattern, random_seed, user_order, cycle_count):
+    # 移動パスを DIR_VECTORS の添字1文字ずつの文字列として生成する (同じ設定なら再実行時もキャッシュを返す)。
+    # floatKeyframes はこの文字列からブラウザ側で組み立てる。
+    spec = motion_path_spec(move_pattern, random_seed, user_order, cycle_count)
+    return encode_path(path_from_spec(spec))
+
+
+@st.cache_data(show_spinner=False)
+def build_corpus(corpus_text):
+    # サイドバーのお題 (1行1題) を期待キー列まで解決してページへ送る形にする (不正な文字があれば ValueError)
+    return corpus_payload(parse_corpus(corpus_text))
+
+
+def to_script_json(obj):
+    # <script> 内に埋め込む JSON ("</script>" で閉じられないよう "</" をエスケープ)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+
+
+@st.cache_resource(show_spinner=False)
+def load_template():
+    # 静的部分 (キー配列・方向ベクトル・イージング表・書き出しスキーマを含む) はプロセス全体で1回だけ組み立てる
+    template = TEMPLATE_PATH.read_text(encoding="utf-8")
+    return (
+        template
+        .replace("/*__ROWS__*/[]", to_script_json(ROWS))
+        .replace("/*__VECTORS__*/[]", to_script_json(list(DIR_VECTORS.values())))
+        .replace("/*__EASE__*/[]", to_script_json(ease_in_out_table()))
+        .replace("/*__SCHEMA__*/[]", to_script_json([[name, field, np.dtype(dtype).str, header] for name, field, header, dtype in COLUMNS]))
+        .replace("/*__FRAME_BUCKETS__*/[]", to_script_json(FRAME_BUCKETS_MS))
+        .replace("/*__ENTRY_CLASSES__*/[]", to_script_json(list(ENTRY_CLASSES)))
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def _declare_keyboard_component():
+    # 組み立て済みのページを一時ディレクトリに書き出し、そこからコンポーネントとして配信する
+    build_dir = Path(tempfile.mkdtemp(prefix="keyboard_page_"))
+    (build_dir / "index.html").write_text(load_template(), encoding="utf-8")
+    return components.declare_component("keyboard_page", path=str(build_dir))
+
+
+def keyboard_component(config, ack=None, key="keyboard"):
+    # ブラウザから送られた未確認バッチ ({"session", "batches"}) を返す (未送信なら None)
+    return _declare_keyboard_component()(config=config, ack=ack, key=key, default=None)
@@ -0,0 +1,239 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from batch_features import discover, labels
+from keyboard_layout import KEY_VALUES
+from keystroke_schema import COLUMNS, COLUMN_NAMES, DTYPES, MISSING_TIME, key_code, read_kbin
+
+# 全セッションの打鍵記録を1つの構造化配列ファイルにまとめ、memmap で読む統合データセット。
+# 解析のたびに多数の小さな CSV を読み直す代わりに、1回まとめておけば必要な部分だけをコピーなしで参照できる。
+#
+#   keystrokes/records.bin   keystroke_schema.COLUMNS どおりのフィールドを持つ構造化配列 (行 = 1打鍵) の生データ
+#   keystrokes/trials.bin    試行ごとの (試行番号, 開始行, 終了行) の構造化配列 (セッションごとに試行番号順)
+#   keystrokes/index.json    確定済みの行数・試行数と、参加者 × 条件ごとの行範囲と trials.bin の範囲
+#
+#   python keystroke_dataset.py data --dataset keystrokes      # data/<参加者>/<条件>/keyboard_data.csv を追加する
+#
+#   ds = KeystrokeDataset("keystrokes")
+#   ds.records["hold_time"]                 # 全打鍵の HoldTime (memmap、コピーなし)
+#   ds.session("p01", "train")              # 1セッションの行 (構造化配列のビュー)
+#   ds.trial("p01", "train", 3)             # 1試行の行。索引の辞書を引くだけで、他の行は読まない
+#
+# 追記は records.bin / trials.bin の末尾に書き足してから index.json を置き換えるので、既存の行は書き直さない。
+# index.json はセッションの一覧だけなので小さいが、まとめて追加するときは数セッションごとにしか書き出さない (flush)。
+# 途中で止まった場合は次の追記で確定済みの行まで切り詰める (session_store と同じ)。
+
+# 構造化配列の dtype (詰め物なし、リトルエンディアン)
+RECORD_DTYPE = np.dtype([(name, DTYPES[name].newbyteorder("<")) for name in COLUMN_NAMES])
+TRIAL_DTYPE = np.dtype([("trial", "<i4"), ("start", "<i8"), ("stop", "<i8")])
+CSV_COLUMNS = {header: name for name, _, header, _ in COLUMNS}
+# consolidate が index.json を書き出す間隔 (セッション数)
+FLUSH_EVERY = 200
+
+
+def read_export(path):
+    # ブラウザが書き出したファイル (CSV / .kbin、gzip 圧縮も可) を列名 → 配列の辞書として読む。
+    # 古いファイルに無い列は整数の時間列 (int64) では keystroke_schema.MISSING_TIME、その他の整数列では 0、実数列では NaN とする
+    columns = dict(read_kbin(path)) if str(path).endswith((".kbin", ".kbin.gz")) else _read_csv(path)
+    missing = {"trial", "key"} - set(columns)
+    if missing:
+        raise ValueError(f"{path}: missing columns {sorted(missing)}")
+    n = len(columns["trial"])
+    if n == 0:
+        raise ValueError(f"{path}: no keystrokes")
+    records = np.zeros(n, dtype=RECORD_DTYPE)
+    for name in COLUMN_NAMES:
+        if name in columns:
+            records[name] = columns[name]
+        elif DTYPES[name] == np.int64:
+            records[name] = MISSING_TIME
+        elif DTYPES[name].kind == "f":
+            records[name] = np.nan
+    return records
+
+
+def _read_csv(path):
+    # 空欄は pandas では NaN になるので、整数の列に入れる前に決まった値にする (NaN のまま変換すると不定な値になる)。
+    # 整数の時間列の空欄は MISSING_TIME、それ以外の整数列 (Trial など) に空欄があるファイルは受け付けない
+    df = pd.read_csv(path, usecols=lambda c: c in CSV_COLUMNS, dtype={"Key": "category"})
+    missing = {"Trial", "Key"} - set(df.columns)
+    if missing:
+        raise ValueError(f"{path}: missing columns {sorted(missing)}")
+    columns = {}
+    for header in df.columns.drop("Key"):
+        name, values = CSV_COLUMNS[header], df[header]
+        if DTYPES[name].kind == "i" and values.isna().any():
+            if DTYPES[name] != np.int64:
+                raise ValueError(f"{path}: blank cells in {header}")
+            values = values.fillna(MISSING_TIME)
+        columns[name] = values.to_numpy()
+    codes = np.array([key_code(str(c)) for c in df["Key"].cat.categories] + [-1], dtype=DTYPES["key"])
+    columns["key"] = codes[df["Key"].cat.codes.to_numpy()]
+    return columns
+
+
+def trial_offsets(records):
+    # 試行番号順に並べ替えた行と、試行ごとの (試行番号, 開始行, 終了行) の TRIAL_DTYPE の配列
+    order = np.argsort(records["trial"], kind="stable")
+    records = records[order]
+    trial = records["trial"]
+    starts = np.flatnonzero(np.r_[True, trial[1:] != trial[:-1]])
+    trials = np.empty(len(starts), dtype=TRIAL_DTYPE)
+    trials["trial"] = trial[starts]
+    trials["start"] = starts
+    trials["stop"] = np.r_[starts[1:], len(trial)]
+    return records, trials
+
+
+class KeystrokeDataset:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.index = self._read_index()
+        # (参加者, 条件) → セッション。試行の行範囲は trials.bin をセッションの範囲内で二分探索する
+        self._sessions = {}
+        self._sources = set()
+        self._unflushed = 0
+        for session in self.index["sessions"]:
+            self._add_to_lookup(session)
+        self.records = self._map("records.bin", RECORD_DTYPE, self.index["rows"])
+        self.trials = self._map("trials.bin", TRIAL_DTYPE, self.index["trials"])
+
+    def _read_index(self):
+        path = self.path / "index.json"
+        if not path.exists():
+            return {"rows": 0, "trials": 0, "dtype": RECORD_DTYPE.descr, "keys": KEY_VALUES, "sessions": []}
+        index = json.loads(path.read_text(encoding="utf-8"))
+        if np.dtype([tuple(f) for f in index["dtype"]]) != RECORD_DTYPE:
+            raise ValueError(f"{self.path}: written with a different schema")
+        if index["keys"] != KEY_VALUES:
+            raise ValueError(f"{self.path}: written with a different key layout")
+        return index
+
+    def _add_to_lookup(self, session):
+        self._sessions[(session["participant"], session["condition"])] = session
+        self._sources.add(session["source"])
+
+    def _map(self, filename, dtype, rows):
+        if rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self.path / filename, dtype=dtype, mode="r", shape=(rows,))
+
+    def __len__(self):
+        return self.index["rows"]
+
+    def sessions(self):
+        # セッションの一覧 (参加者, 条件, 元のファイル, 行数)
+        return pd.DataFrame([
+            {"participant": s["participant"], "condition": s["condition"], "source": s["source"], "rows": s["stop"] - s["start"]}
+            for s in self.index["sessions"]
+        ], columns=["participant", "condition", "source", "rows"])
+
+    def session(self, participant, condition=""):
+        session = self._sessions[(participant, condition)]
+        return self.records[session["start"]:session["stop"]]
+
+    def trial(self, participant, condition, trial):
+        first, last = self._sessions[(participant, condition)]["trial_index"]
+        trials = self.trials[first:last]
+        i = int(np.searchsorted(trials["trial"], trial))
+        if i == len(trials) or trials["trial"][i] != trial:
+            raise KeyError((participant, condition, trial))
+        return self.records[trials["start"][i]:trials["stop"][i]]
+
+    def has_source(self, source):
+        return str(source) in self._sources
+
+    def append(self, records, participant, condition="", source=None, flush=True):
+        # 1セッション分の行 (read_export の戻り値) を末尾に追加する。
+        # flush=False なら index.json は書き出さない (flush() を呼ぶまで、開き直すと追加していないことになる)
+        if (participant, condition) in self._sessions:
+            raise ValueError(f"session already in dataset: {participant}/{condition}")
+        records, trials = trial_offsets(np.asarray(records, dtype=RECORD_DTYPE))
+        start, first = self.index["rows"], self.index["trials"]
+        trials["start"] += start
+        trials["stop"] += start
+        self.path.mkdir(parents=True, exist_ok=True)
+        for filename, values, offset in (("records.bin", records, start), ("trials.bin", trials, first)):
+            with open(self.path / filename, "ab") as f:
+                f.truncate(offset * values.dtype.itemsize)
+                f.write(values.tobytes())
+        session = {
+            "participant": participant, "condition": condition, "source": None if source is None else str(source),
+            "start": start, "stop": start + len(records), "trial_index": [first, first + len(trials)],
+        }
+        self.index = {
+            **self.index, "rows": session["stop"], "trials": session["trial_index"][1],
+            "sessions": self.index["sessions"] + [session],
+        }
+        self._add_to_lookup(session)
+        self._unflushed += 1
+        if flush:
+            self.flush()
+        self.records = self._map("records.bin", RECORD_DTYPE, self.index["rows"])
+        self.trials = self._map("trials.bin", TRIAL_DTYPE, self.index["trials"])
+        return session
+
+    def flush(self):
+        # 追加済みのセッションを index.json に書き出して確定する
+        if self._unflushed == 0:
+            return
+        tmp = self.path / "index.json.tmp"
+        tmp.write_text(json.dumps(self.index, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp, self.path / "index.json")
+        self._unflushed = 0
+
+
+def consolidate(roots, dataset_path, workers=None, progress=sys.stderr):
+    # roots の下のセッション (batch_features.discover と同じ構成) のうち、まだ入っていないものを追加する。
+    # ファイルの読み込みは並列に行い、書き込みは見つかった順に1つずつ行う。index.json は FLUSH_EVERY セッションごとと最後に書き出す
+    dataset = KeystrokeDataset(dataset_path)
+    pending = [(root, path) for root, path in discover(roots) if not dataset.has_source(path)]
+    print(f"{len(pending)} sessions to add to {dataset_path} ({len(dataset.index['sessions'])} already there)", file=progress)
+    errors = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        try:
+            for i, ((root, path), (records, error)) in enumerate(zip(pending, pool.map(_read, [p for _, p in pending])), 1):
+                if error is None:
+                    try:
+                        participant, condition = labels(root, path)
+                        dataset.append(records, participant, condition, source=path, flush=i % FLUSH_EVERY == 0)
+                    except ValueError as e:
+                        error = str(e)
+                if error is None:
+                    print(f"[{i}/{len(pending)}] {path}: {len(records)} rows", file=progress)
+                else:
+                    errors.append(error)
+                    print(f"[{i}/{len(pending)}] {path}: ERROR {error}", file=progress)
+        finally:
+            dataset.flush()
+    return dataset, errors
+
+
+def _read(path):
+    try:
+        return read_export(path), None
+    except (ValueError, KeyError, OSError, pd.errors.ParserError) as e:
+        return None, str(e)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="打鍵記録を1つの memmap データセットにまとめる")
+    parser.add_argument("roots", nargs="+", type=Path, help="参加者ごとのディレクトリを含むディレクトリ")
+    parser.add_argument("--dataset", type=Path, default=Path("keystrokes"), help="データセットのディレクトリ")
+    parser.add_argument("--workers", type=int, default=None, help="読み込みの並列プロセス数 (既定: CPU コア数)")
+    args = parser.parse_args(argv)
+
+    dataset, errors = consolidate(args.roots, args.dataset, workers=args.workers)
+    print(f"{args.dataset}: {len(dataset)} rows, {len(dataset.index['sessions'])} sessions, {len(errors)} files skipped", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+import numpy as np
+import pandas as pd
+
+from keyboard_layout import KEY_VALUES
+from keystroke_schema import FRAME_BUCKETS_MS, key_code, read_kbin, time_values
+from phrase_corpus import CORRECT, INSERTION, SUBSTITUTION
+
+# ブラウザが書き出す keyboard_data.csv (.csv.gz / .kbin / .kbin.gz も可) から、試行ごと・参加者ごとの特徴量を計算する。
+# 集計はすべてグループ ID に対する NumPy の一括演算 (bincount / グループ内のソート) で行い、行ごとの Python ループは使わない。
+#
+#   table = read_keystrokes(["p01/keyboard_data.csv", "p02/keyboard_data.csv"])
+#   trial_features(table)        # 参加者 × 試行ごとの特徴量
+#   participant_features(table)  # 参加者ごとの特徴量
+#   digraph_latencies(table)     # 参加者 × 2連打 (前のキー → 今のキー) ごとの遅延
+#   read_frames([...])           # keyboard_frames.csv (試行ごとのフレーム時間)。participant, trial で結合できる
+
+# 使用する列 (CSV ヘッダ → 読み込み時の dtype)
+CSV_DTYPES = {
+    "Trial": np.int32,
+    "Key": "category",
+    "HoldTime(ms)": np.float64,
+    "DownDown(ms)": np.float64,
+    "UpDown(ms)": np.float64,
+    "Scale": np.float64,
+    "Kb_X": np.float64,
+    "Kb_Y": np.float64,
+    "Pressure": np.float64,
+    "FingerArea": np.float64,
+    "Entry": np.int16,
+}
+# 打鍵の分類の導入前に書き出したファイルには無い列 (無ければ 0 = 未分類として読む)
+OPTIONAL_COLUMNS = {"Entry"}
+
+BS_CODE = KEY_VALUES.index("BS")
+
+
+def read_keystrokes(paths, participants=None):
+    # CSV (1ファイル = 1参加者・1条件) を読み込み、列名 → 配列の辞書にまとめる。
+    # participants を省略した場合は paths の順番を参加者 ID とする。
+    if isinstance(paths, (str, bytes)) or hasattr(paths, "__fspath__"):
+        paths = [paths]
+    if participants is None:
+        participants = range(len(paths))
+    tables = [_read_one(path, participant) for path, participant in zip(paths, participants)]
+    return {name: np.concatenate([t[name] for t in tables]) for name in tables[0]}
+
+
+def _read_one(path, participant):
+    if str(path).endswith((".kbin", ".kbin.gz")):
+        return _read_one_kbin(path, participant)
+    df = pd.read_csv(path, usecols=lambda c: c in CSV_DTYPES, dtype=CSV_DTYPES)
+    missing = set(CSV_DTYPES) - set(df.columns) - OPTIONAL_COLUMNS
+    if missing:
+        raise ValueError(f"{path}: missing columns {sorted(missing)}")
+    entry = df["Entry"].to_numpy(np.int16) if "Entry" in df else np.zeros(len(df), dtype=np.int16)
+    # Key はカテゴリの種類数 (高々キー数) だけ変換し、行へは添字で展開する
+    category_codes = np.array([key_code(str(c)) for c in df["Key"].cat.categories] + [-1], dtype=np.int16)
+    return {
+        "participant": np.full(len(df), participant, dtype=np.int32),
+        "trial": df["Trial"].to_numpy(np.int32),
+        "key": category_codes[df["Key"].cat.codes.to_numpy()],
+        "hold": df["HoldTime(ms)"].to_numpy(),
+        "down_down": df["DownDown(ms)"].to_numpy(),
+        "up_down": df["UpDown(ms)"].to_numpy(),
+        "scale": df["Scale"].to_numpy(),
+        "kb_x": df["Kb_X"].to_numpy(),
+        "kb_y": df["Kb_Y"].to_numpy(),
+        "pressure": df["Pressure"].to_numpy(),
+        "area": df["FingerArea"].to_numpy(),
+        "entry": entry,
+    }
+
+
+def read_frames(paths, participants=None):
+    # フレーム計測 CSV を読み込み、参加者 × 試行ごとの表にする (落ちたフレームの多い試行を除外する用途)
+    if isinstance(paths, (str, bytes)) or hasattr(paths, "__fspath__"):
+        paths = [paths]
+    if participants is None:
+        participants = range(len(paths))
+    frames = []
+    for path, participant in zip(paths, participants):
+        df = pd.read_csv(path)
+        df.insert(0, "participant", participant)
+        frames.append(df)
+    frames = pd.concat(frames, ignore_index=True)
+    edges = [0] + FRAME_BUCKETS_MS
+    frames.columns = ["participant", "trial", "frames", "dropped_frames", "frame_mean", "frame_max", "refresh_interval"] + [
+        f"frames_{lo}_{hi}ms" for lo, hi in zip(edges, edges[1:])
+    ] + [f"frames_{edges[-1]}ms_plus"]
+    return frames
+
+
+def _read_one_kbin(path, participant):
+    columns = read_kbin(path)
+    return {
+        "participant": np.full(len(columns["trial"]), participant, dtype=np.int32),
+        "trial": columns["trial"].astype(np.int32),
+        "key": columns["key"].astype(np.int16),
+        "hold": time_values(columns["hold_time"]),
+        "down_down": time_values(columns["down_down"]),
+        "up_down": time_values(columns["up_down"]),
+        "scale": columns["scale"].astype(np.float64),
+        "kb_x": columns["kb_x"].astype(np.float64),
+        "kb_y": columns["kb_y"].astype(np.float64),
+        "pressure": columns["pressure"].astype(np.float64),
+        "area": columns["finger_area"].astype(np.float64),
+        "entry": columns["entry"].astype(np.int16) if "entry" in columns else np.zeros(len(columns["trial"]), dtype=np.int16),
+    }
+
+
+def _group_ids(*keys):
+    # 複数の整数キーを1つのグループ ID (0..n-1) にまとめる
+    combined = np.zeros(len(keys[0]), dtype=np.int64)
+    for key in keys:
+        key = key.astype(np.int64)
+        combined = combined * (int(key.max(initial=0)) + 2) + (key + 1)
+    if np.all(combined[1:] >= combined[:-1]):
+        # CSV を連結しただけの表は参加者・試行順に並んでいるので、ソートせずに境目だけで番号を振る
+        boundary = np.ones(len(combined), dtype=bool)
+        boundary[1:] = combined[1:] != combined[:-1]
+        return np.cumsum(boundary) - 1, int(boundary.sum()), np.flatnonzero(boundary)
+    uniq, first, inverse = np.unique(combined, return_index=True, return_inverse=True)
+    return inverse, len(uniq), first
+
+
+def _trial_starts(table):
+    # 各試行の最初の打鍵 (DownDown/UpDown が試行開始からの時間になっている行)
+    participant, trial = table["participant"], table["trial"]
+    starts = np.ones(len(trial), dtype=bool)
+    starts[1:] = (participant[1:] != participant[:-1]) | (trial[1:] != trial[:-1])
+    return starts
+
+
+def grouped_mean(gid, n_groups, values):
+    # グループごとの平均 (NaN の行は除く)。並べ替えが要らないので grouped_stats より速い
+    valid = np.isfinite(values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.bincount(gid[valid], values[valid], n_groups) / np.bincount(gid[valid], minlength=n_groups)
+
+
+def grouped_stats(gid, n_groups, values, mask=None):
+    # グループごとの count / mean / std / min / median / max (NaN と mask=False の行は除く)
+    valid = np.isfinite(values)
+    if mask is not None:
+        valid &= mask
+    g = gid[valid]
+    v = values[valid]
+    count = np.bincount(g, minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(g, v, n_groups) / count
+        dev = v - mean[g]
+        std = np.sqrt(np.bincount(g, dev * dev, n_groups) / (count - 1))
+    # 件数 0 では 0 / -1 = -0.0 になるので、件数 2 未満は NaN にそろえる
+    std[count < 2] = np.nan
+
+    # 中央値・最小・最大はグループ内で並べ替えて求める。グループの並び替えは必要なときだけ1回行う
+    if np.any(g[1:] < g[:-1]):
+        v = v[np.argsort(g, kind="stable")]
+    lo, median, hi = _segment_order_stats(v, np.cumsum(count) - count, count)
+    return {
+        "count": count,
+        "mean": mean,
+        "std": std,
+        "min": lo,
+        "median": median,
+        "max": hi,
+    }
+
+
+def _segment_order_stats(v, start, count):
+    # グループ順に並んだ値 v (グループ i は v[start[i]:start[i] + count[i]]) の最小・中央値・最大。
+    # 長さが同じ 2 のべき乗に収まるグループごとに (グループ数 × 幅) の配列へ写し (グループの後ろは inf)、行ごとにソートする。
+    # ループは幅の種類 (高々 log2(最大の長さ) 通り) だけで、写す量は値の数の 2 倍未満に収まる
+    n_groups = len(count)
+    lo = np.full(n_groups, np.nan)
+    median = np.full(n_groups, np.nan)
+    hi = np.full(n_groups, np.nan)
+    has = count > 0
+    if not has.any():
+        return lo, median, hi
+    width = np.zeros(n_groups, dtype=np.int64)
+    width[has] = 1 << np.ceil(np.log2(count[has])).astype(np.int64)
+    padded = np.concatenate([v, np.full(width.max(), np.inf)])
+    for w in np.unique(width[has]):
+        groups = np.flatnonzero(width == w)
+        c = count[groups]
+        block = np.lib.stride_tricks.sliding_window_view(padded, w)[start[groups]]
+        block[np.arange(w) >= c[:, None]] = np.inf
+        block.sort(axis=1)
+        rows = np.arange(len(groups))
+        lo[groups] = block[rows, 0]
+        hi[groups] = block[rows, c - 1]
+        median[groups] = (block[rows, (c - 1) // 2] + block[rows, c // 2]) / 2
+    return lo, median, hi
+
+
+def grouped_corr(gid, n_groups, x, y, mask=None):
+    # グループごとのピアソン相関係数 (分散 0 や 2 点未満のグループは NaN)
+    valid = np.isfinite(x) & np.isfinite(y)
+    if mask is not None:
+        valid &= mask
+    g, x, y = gid[valid], x[valid], y[valid]
+    count = np.bincount(g, minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dx = x - (np.bincount(g, x, n_groups) / count)[g]
+        dy = y - (np.bincount(g, y, n_groups) / count)[g]
+        cov = np.bincount(g, dx * dy, n_groups)
+        r = cov / np.sqrt(np.bincount(g, dx * dx, n_groups) * np.bincount(g, dy * dy, n_groups))
+    return r
+
+
+def _offset(table, gid_participant, n_participants):
+    # 参加者ごとの平均位置からのキーボードのずれ (px)
+    x, y = table["kb_x"], table["kb_y"]
+    mean_x = grouped_mean(gid_participant, n_participants, x)
+    mean_y = grouped_mean(gid_participant, n_participants, y)
+    return np.hypot(x - mean_x[gid_participant], y - mean_y[gid_participant])
+
+
+def _features(table, gid, n_groups, offset, flight):
+    features = {"n_keys": np.bincount(gid, minlength=n_groups)}
+    features["n_backspace"] = np.bincount(gid, table["key"] == BS_CODE, n_groups).astype(np.int64)
+    # ブラウザが打鍵ごとに付けた分類 (Entry) の集計。誤りの割合は分類済みの文字入力 (BS 以外) に対する比
+    entry = table["entry"]
+    features["n_substitution"] = np.bincount(gid, entry == SUBSTITUTION, n_groups).astype(np.int64)
+    features["n_insertion"] = np.bincount(gid, entry == INSERTION, n_groups).astype(np.int64)
+    n_entered = np.bincount(gid, (entry == CORRECT) | (entry == SUBSTITUTION) | (entry == INSERTION), n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        features["error_rate"] = (features["n_substitution"] + features["n_insertion"]) / n_entered
+    for name, values, mask in (
+        ("hold", table["hold"], None),
+        ("down_down", table["down_down"], flight),
+        ("up_down", table["up_down"], flight),
+    ):
+        for stat, result in grouped_stats(gid, n_groups, values, mask).items():
+            if stat != "count":
+                features[f"{name}_{stat}"] = result
+    for name in ("scale", "pressure", "area"):
+        features[f"{name}_mean"] = grouped_mean(gid, n_groups, table[name])
+    features["offset_mean"] = grouped_mean(gid, n_groups, offset)
+    features["corr_hold_scale"] = grouped_corr(gid, n_groups, table["hold"], table["scale"])
+    features["corr_down_down_scale"] = grouped_corr(gid, n_groups, table["down_down"], table["scale"], flight)
+    features["corr_hold_offset"] = grouped_corr(gid, n_groups, table["hold"], offset)
+    features["corr_down_down_offset"] = grouped_corr(gid, n_groups, table["down_down"], offset, flight)
+    return features
+
+
+def trial_features(table):
+    # 参加者 × 試行ごとの特徴量 (1行 = 1試行)
+    gid_participant, n_participants, _ = _group_ids(table["participant"])
+    offset = _offset(table, gid_participant, n_participants)
+    flight = ~_trial_starts(table)
+    gid, n_groups, first = _group_ids(table["participant"], table["trial"])
+    features = _features(table, gid, n_groups, offset, flight)
+    index = {"participant": table["participant"][first], "trial": table["trial"][first]}
+    return pd.DataFrame({**index, **features})
+
+
+def participant_features(table):
+    # 参加者ごとの特徴量 (1行 = 1参加者)
+    gid, n_groups, first = _group_ids(table["participant"])
+    offset = _offset(table, gid, n_groups)
+    flight = ~_trial_starts(table)
+    features = _features(table, gid, n_groups, offset, flight)
+    features["n_trials"] = np.bincount(gid, _trial_starts(table), n_groups).astype(np.int64)
+    return pd.DataFrame({"participant": table["participant"][first], **features})
+
+
+def digraph_latencies(table, min_count=1):
+    # 参加者 × 2連打 (前のキー → 今のキー) ごとの DownDown / UpDown の統計。試行をまたぐ組は数えない。
+    flight = ~_trial_starts(table)
+    prev_key = np.empty_like(table["key"])
+    prev_key[1:] = table["key"][:-1]
+    prev_key[0] = -1
+    gid, n_groups, first = _group_ids(table["participant"][flight], prev_key[flight], table["key"][flight])
+    # 組は行の順に並んでいないので、組の順に1回だけ並べ替えてから集計する (grouped_stats ごとに並べ替えない)
+    order = np.argsort(gid, kind="stable")
+    down_down = grouped_stats(gid[order], n_groups, table["down_down"][flight][order])
+    up_down = grouped_stats(gid[order], n_groups, table["up_down"][flight][order])
+
+    rows = np.flatnonzero(flight)[first]
+    key_names = np.array(KEY_VALUES + [""], dtype=object)
+    result = pd.DataFrame({
+        "participant": table["participant"][rows],
+        "first_key": key_names[prev_key[rows]],
+        "second_key": key_names[table["key"][rows]],
+        "count": down_down["count"],
+        "down_down_mean": down_down["mean"],
+        "down_down_std": down_down["std"],
+        "down_down_median": down_down["median"],
+        "up_down_mean": up_down["mean"],
+        "up_down_std": up_down["std"],
+        "up_down_median": up_down["median"],
+    })
+    return result[result["count"] >= min_count].reset_index(drop=True)
@@ -0,0 +1,140 @@
+import gzip
+import json
+from pathlib import Path
+
+import numpy as np
+
+from keyboard_layout import KEY_CODES, KEY_VALUES
+
+# 打鍵記録の固定スキーマ (ブラウザが書き出す CSV / .kbin の列順と同じ)。
+# (列名, ブラウザの記録のフィールド名, CSV ヘッダ, dtype)
+COLUMNS = [
+    ("trial", "trial", "Trial", np.int32),
+    ("key", "key", "Key", np.int16),
+    ("time_from_start", "timeFromStart", "TimeFromStart(ms)", np.int64),
+    ("down_time", "downTime", "DownTime(ms)", np.int64),
+    ("up_time", "upTime", "UpTime(ms)", np.int64),
+    ("hold_time", "holdTime", "HoldTime(ms)", np.int64),
+    ("down_down", "downDown", "DownDown(ms)", np.int64),
+    ("up_down", "upDown", "UpDown(ms)", np.int64),
+    ("scale", "kbScale", "Scale", np.float32),
+    ("kb_x", "kbX", "Kb_X", np.float32),
+    ("kb_y", "kbY", "Kb_Y", np.float32),
+    ("pressure", "pressure", "Pressure", np.float32),
+    ("finger_area", "area", "FingerArea", np.float32),
+    ("scale_phase", "scalePhase", "ScalePhase", np.float32),
+    ("move_phase", "movePhase", "MovePhase", np.float64),
+    ("time_from_start_hr", "timeFromStartHR", "TimeFromStartHR(ms)", np.float64),
+    ("down_time_hr", "downTimeHR", "DownTimeHR(ms)", np.float64),
+    ("up_time_hr", "upTimeHR", "UpTimeHR(ms)", np.float64),
+    ("hold_time_hr", "holdTimeHR", "HoldTimeHR(ms)", np.float64),
+    ("down_down_hr", "downDownHR", "DownDownHR(ms)", np.float64),
+    ("up_down_hr", "upDownHR", "UpDownHR(ms)", np.float64),
+    ("overlap", "overlap", "Overlap", np.int16),
+    ("rollover", "rollover", "Rollover", np.int16),
+    ("down_handler_lag", "downHandlerLag", "DownHandlerLag(ms)", np.float32),
+    ("down_paint_lag", "downPaintLag", "DownPaintLag(ms)", np.float32),
+    ("up_handler_lag", "upHandlerLag", "UpHandlerLag(ms)", np.float32),
+    ("up_paint_lag", "upPaintLag", "UpPaintLag(ms)", np.float32),
+    ("touch_dx", "touchDX", "TouchDX", np.float32),
+    ("touch_dy", "touchDY", "TouchDY", np.float32),
+    ("touch_nx", "touchNX", "TouchNX", np.float32),
+    ("touch_ny", "touchNY", "TouchNY", np.float32),
+    # 打鍵の分類 (phrase_corpus.ENTRY_CLASSES の添字)
+    ("entry", "entry", "Entry", np.int16),
+]
+
+# ブラウザが試行ごとに数えるフレーム時間ヒストグラムの区切り (ms)。
+# 区間は [前の区切り, 区切り) で、最後の区切り以上は1つの区間にまとめる
+FRAME_BUCKETS_MS = [10, 14, 18, 25, 35, 50, 70, 100, 200]
+
+COLUMN_NAMES = [c[0] for c in COLUMNS]
+CSV_HEADERS = [c[2] for c in COLUMNS]
+DTYPES = {c[0]: np.dtype(c[3]) for c in COLUMNS}
+
+# key 列は KEY_VALUES の添字 (rows に無いキーは -1)
+UNKNOWN_KEY = -1
+
+# 整数の時間列 (int64) の欠損値 (前のキーを離す前に試行が終わった UpDown など)。
+# 0 ms は実際の値でもあるので使わない。解析では time_values() で NaN に直す
+MISSING_TIME = np.iinfo(np.int64).min
+
+
+def key_code(val):
+    return KEY_CODES.get(val, UNKNOWN_KEY)
+
+
+def key_value(code):
+    return KEY_VALUES[code] if code >= 0 else ""
+
+
+def time_values(column):
+    # 整数の時間列を float64 にし、欠損 (MISSING_TIME) を NaN にする
+    column = np.asarray(column)
+    values = column.astype(np.float64)
+    values[column == MISSING_TIME] = np.nan
+    return values
+
+
+def records_to_columns(records):
+    # ブラウザの記録 (dict のリスト) を列ごとの配列に変換する。
+    # 文字列で届く数値 (toFixed) も変換し、欠損は時間の整数列 (int64) では MISSING_TIME、
+    # その他の整数列では 0、実数列では NaN とする。
+    columns = {}
+    for name, field, _, dtype in COLUMNS:
+        if name == "key":
+            columns[name] = np.fromiter((key_code(r.get(field)) for r in records), dtype, len(records))
+        elif dtype is np.int64:
+            values = (MISSING_TIME if r.get(field) in (None, "") else int(r[field]) for r in records)
+            columns[name] = np.fromiter(values, dtype, len(records))
+        elif np.issubdtype(dtype, np.integer):
+            columns[name] = np.fromiter((int(r.get(field) or 0) for r in records), dtype, len(records))
+        else:
+            values = (np.nan if r.get(field) in (None, "") else float(r[field]) for r in records)
+            columns[name] = np.fromiter(values, dtype, len(records))
+    return columns
+
+
+def read_kbin(path):
+    # ブラウザが書き出したバイナリ (.kbin / .kbin.gz) を列名 → 配列の辞書として読み込む。
+    #   "KBIN" + ヘッダ長 (uint32 LE) + JSON ヘッダ + 列ごとの生配列 (各列は 8byte 境界に揃える)
+    # 非圧縮のファイルはコピーせず np.memmap で参照する。
+    path = Path(path)
+    with open(path, "rb") as f:
+        compressed = f.read(2) == b"\x1f\x8b"
+    buffer = gzip.decompress(path.read_bytes()) if compressed else np.memmap(path, dtype=np.uint8, mode="r")
+    if bytes(buffer[:4]) != b"KBIN":
+        raise ValueError(f"{path} is not a .kbin file")
+    header_length = int(np.frombuffer(buffer[4:8], dtype="<u4")[0])
+    header = json.loads(bytes(buffer[8:8 + header_length]).decode("utf-8"))
+    rows = header["rows"]
+
+    columns = {}
+    offset = 8 + header_length
+    for column in header["columns"]:
+        dtype = np.dtype(column["dtype"])
+        columns[column["name"]] = np.frombuffer(buffer, dtype=dtype, count=rows, offset=offset)
+        offset += -(-rows * dtype.itemsize // 8) * 8
+
+    # 書き出し時のキー配列が現在と違う場合はキーコードを振り直す
+    if header["keys"] != KEY_VALUES:
+        remap = np.array([key_code(val) for val in header["keys"]] + [UNKNOWN_KEY], dtype=DTYPES["key"])
+        columns["key"] = remap[columns["key"]]
+    return columns
+
+
+def write_kbin(columns, path):
+    # 列名 → 配列の辞書を read_kbin と同じ形式で書き出す (拡張子が .gz なら gzip 圧縮)
+    rows = len(columns[COLUMN_NAMES[0]])
+    header = json.dumps({
+        "format": "kbin", "version": 1, "rows": rows, "keys": KEY_VALUES,
+        "columns": [{"name": name, "dtype": DTYPES[name].str} for name in COLUMN_NAMES],
+    }, separators=(",", ":")).encode("utf-8")
+    header += b" " * (-(8 + len(header)) % 8)
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "wb") as f:
+        f.write(b"KBIN" + np.uint32(len(header)).astype("<u4").tobytes() + header)
+        for name in COLUMN_NAMES:
+            data = np.ascontiguousarray(columns[name], dtype=DTYPES[name])
+            f.write(data.tobytes())
+            f.write(b"\0" * (-data.nbytes % 8))
@@ -0,0 +1,214 @@
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from keyboard_layout import KEY_VALUES
+from keystroke_features import _trial_starts, read_keystrokes
+
+# キーごと・2連打 (前のキー → 今のキー) ごとの打鍵時間の累積統計 (件数・平均・分散・最小・最大)。
+# 生の行を持たずに部分集計 (件数・平均・偏差平方和 M2) だけを持ち、ファイルごとの集計を後から正確に併合できる。
+# 新しい keyboard_data.csv が届いたら、その分だけ集計して既存の集計に併合すれば全体を計算し直さなくてよい。
+#
+#   stats = KeystrokeStats.from_table(read_keystrokes("p01/keyboard_data.csv"))
+#   stats.merge(KeystrokeStats.from_table(read_keystrokes("p02/keyboard_data.csv")))
+#   stats = collect_stats(paths, workers=4)        # ファイルごとに並列に集計して併合する (map-reduce)
+#   stats.save("cohort_stats.npz"); KeystrokeStats.load("cohort_stats.npz")
+#   stats.key_table()                               # キーごとの統計 (1行 = 1キー)
+#   stats.digraph_table(min_count=5)                # 2連打ごとの統計 (1行 = 1組)
+#
+#   python keystroke_stats.py --state cohort_stats.npz data/*/keyboard_data.csv   # 未集計のファイルだけ追加する
+
+METRICS = ("hold", "down_down", "up_down")
+# キーコード -1 (rows に無いキー) は最後の添字にまとめる
+N_KEYS = len(KEY_VALUES) + 1
+KEY_NAMES = np.array(KEY_VALUES + [""], dtype=object)
+
+
+class RunningStats:
+    # グループ (添字 0..n-1) ごとの件数・平均・偏差平方和・最小・最大。
+    # バッチはグループごとに2パス (平均 → 偏差平方和) で集計し、既存の集計とは Chan らの式で併合する
+    def __init__(self, n_groups):
+        self.count = np.zeros(n_groups, dtype=np.int64)
+        self.mean = np.zeros(n_groups)
+        self.m2 = np.zeros(n_groups)
+        self.min = np.full(n_groups, np.inf)
+        self.max = np.full(n_groups, -np.inf)
+
+    @classmethod
+    def from_values(cls, gid, values, n_groups):
+        # NaN の行は数えない
+        stats = cls(n_groups)
+        valid = np.isfinite(values)
+        g, v = gid[valid], values[valid]
+        stats.count = np.bincount(g, minlength=n_groups).astype(np.int64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.bincount(g, v, n_groups) / stats.count
+        stats.mean = np.where(stats.count > 0, mean, 0.0)
+        stats.m2 = np.bincount(g, (v - stats.mean[g]) ** 2, n_groups)
+        np.minimum.at(stats.min, g, v)
+        np.maximum.at(stats.max, g, v)
+        return stats
+
+    def merge(self, other):
+        count = self.count + other.count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = other.mean - self.mean
+            weight = np.where(count > 0, other.count / count, 0.0)
+            self.mean = self.mean + delta * weight
+            self.m2 = self.m2 + other.m2 + delta * delta * self.count * weight
+        self.count = count
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        return self
+
+    def std(self):
+        # 標本標準偏差 (件数 2 未満は NaN)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(np.where(self.count > 1, self.m2 / (self.count - 1), np.nan))
+
+    def summary(self):
+        has = self.count > 0
+        return {
+            "count": self.count,
+            "mean": np.where(has, self.mean, np.nan),
+            "std": self.std(),
+            "min": np.where(has, self.min, np.nan),
+            "max": np.where(has, self.max, np.nan),
+        }
+
+    def arrays(self, prefix):
+        return {f"{prefix}_{name}": getattr(self, name) for name in ("count", "mean", "m2", "min", "max")}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        stats = cls(len(arrays[f"{prefix}_count"]))
+        for name in ("count", "mean", "m2", "min", "max"):
+            setattr(stats, name, np.array(arrays[f"{prefix}_{name}"]))
+        return stats
+
+
+class KeystrokeStats:
+    # キーごと (N_KEYS) と2連打ごと (N_KEYS × N_KEYS) の METRICS の累積統計と、集計済みのファイル名
+    def __init__(self):
+        self.keys = {metric: RunningStats(N_KEYS) for metric in METRICS}
+        self.digraphs = {metric: RunningStats(N_KEYS * N_KEYS) for metric in METRICS}
+        self.sources = []
+
+    @classmethod
+    def from_table(cls, table, source=None):
+        # keystroke_features.read_keystrokes の表から集計する。
+        # DownDown / UpDown と2連打は試行の最初の打鍵 (試行開始からの時間) を除き、試行をまたぐ組も数えない
+        stats = cls()
+        key = np.where(table["key"] < 0, N_KEYS - 1, table["key"]).astype(np.int64)
+        flight = ~_trial_starts(table)
+        prev_key = np.roll(key, 1)
+        digraph = (prev_key * N_KEYS + key)[flight]
+        for metric in METRICS:
+            values = table[metric]
+            if metric == "hold":
+                stats.keys[metric] = RunningStats.from_values(key, values, N_KEYS)
+            else:
+                stats.keys[metric] = RunningStats.from_values(key[flight], values[flight], N_KEYS)
+            stats.digraphs[metric] = RunningStats.from_values(digraph, values[flight], N_KEYS * N_KEYS)
+        if source is not None:
+            stats.sources.append(str(source))
+        return stats
+
+    @classmethod
+    def from_file(cls, path):
+        return cls.from_table(read_keystrokes(path), source=path)
+
+    def merge(self, other):
+        # 同じファイルを二重に数えないよう、集計済みのファイルが重なる併合は受け付けない
+        overlap = set(self.sources) & set(other.sources)
+        if overlap:
+            raise ValueError(f"already merged: {sorted(overlap)}")
+        for metric in METRICS:
+            self.keys[metric].merge(other.keys[metric])
+            self.digraphs[metric].merge(other.digraphs[metric])
+        self.sources += other.sources
+        return self
+
+    def key_table(self, min_count=1):
+        table = {"key": KEY_NAMES}
+        for metric in METRICS:
+            for stat, values in self.keys[metric].summary().items():
+                table[f"{metric}_{stat}"] = values
+        df = pd.DataFrame(table)
+        return df[df["hold_count"] >= min_count].reset_index(drop=True)
+
+    def digraph_table(self, min_count=1):
+        index = np.arange(N_KEYS * N_KEYS)
+        table = {"first_key": KEY_NAMES[index // N_KEYS], "second_key": KEY_NAMES[index % N_KEYS]}
+        for metric in METRICS:
+            for stat, values in self.digraphs[metric].summary().items():
+                table[f"{metric}_{stat}"] = values
+        df = pd.DataFrame(table)
+        return df[df["down_down_count"] >= min_count].reset_index(drop=True)
+
+    def save(self, path):
+        arrays = {"key_values": np.array(KEY_VALUES), "sources": np.array(self.sources, dtype=str)}
+        for metric in METRICS:
+            arrays.update(self.keys[metric].arrays(f"key_{metric}"))
+            arrays.update(self.digraphs[metric].arrays(f"digraph_{metric}"))
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            if arrays["key_values"].tolist() != KEY_VALUES:
+                raise ValueError(f"{path}: saved with a different key layout")
+            stats = cls()
+            for metric in METRICS:
+                stats.keys[metric] = RunningStats.from_arrays(arrays, f"key_{metric}")
+                stats.digraphs[metric] = RunningStats.from_arrays(arrays, f"digraph_{metric}")
+            stats.sources = arrays["sources"].tolist()
+        return stats
+
+
+def collect_stats(paths, workers=None, stats=None):
+    # ファイルごとの集計 (map) を workers 個のプロセスで並列に行い、順に併合する (reduce)。
+    # stats を渡すとそこに追加する。集計済みのファイルは読み飛ばす
+    stats = stats if stats is not None else KeystrokeStats()
+    done = set(stats.sources)
+    paths = [p for p in dict.fromkeys(str(p) for p in paths) if p not in done]
+    if workers == 1:
+        return _reduce(stats, map(KeystrokeStats.from_file, paths))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return _reduce(stats, pool.map(KeystrokeStats.from_file, paths))
+
+
+def _reduce(stats, results):
+    for result in results:
+        stats.merge(result)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="キーごと・2連打ごとの打鍵時間の累積統計を更新する")
+    parser.add_argument("paths", nargs="+", type=Path, help="keyboard_data.csv (.csv.gz / .kbin / .kbin.gz も可)")
+    parser.add_argument("--state", type=Path, required=True, help="累積統計の保存先 (.npz)。あれば追加で集計する")
+    parser.add_argument("--workers", type=int, default=None, help="並列プロセス数 (既定: CPU コア数)")
+    parser.add_argument("--keys-csv", type=Path, help="キーごとの統計の書き出し先")
+    parser.add_argument("--digraphs-csv", type=Path, help="2連打ごとの統計の書き出し先")
+    parser.add_argument("--min-count", type=int, default=1, help="書き出す組の最小件数")
+    args = parser.parse_args(argv)
+
+    stats = KeystrokeStats.load(args.state) if args.state.exists() else KeystrokeStats()
+    before = len(stats.sources)
+    collect_stats(args.paths, workers=args.workers, stats=stats)
+    stats.save(args.state)
+    print(f"{args.state}: {len(stats.sources) - before} files added, {len(stats.sources)} files in total")
+    if args.keys_csv:
+        stats.key_table(args.min_count).to_csv(args.keys_csv, index=False)
+    if args.digraphs_csv:
+        stats.digraph_table(args.min_count).to_csv(args.digraphs_csv, index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import numpy as np
+
+from keyboard_layout import DIR_VECTORS
+
+# 移動パス (DIR_VECTORS の添字の列) の生成。streamlit に依存しないので、解析側でも
+# セッションと一緒に保存した設定 (spec) から実験中とまったく同じパスを再生成できる。
+#
+#   spec = motion_spec(seed=42, cycle_count=2000)         # ランダム: 8方向を1回ずつ使う並べ替え × サイクル数
+#   spec = motion_spec(order=[0, 1, 2, 3, 4, 5, 6, 7])    # 規則的: 指定した順序の繰り返し
+#   dirs = path_from_spec(spec)                           # uint8 の配列 (長さ 8 × サイクル数)
+#   tx, ty = path_offsets(dirs, move_phase, move_range)   # CSV の MovePhase からその時点の移動量 (px)
+
+# 乱数列と並べ替え方を変えると同じシードでも別のパスになるので、変えるときは名前も変える
+GENERATOR = "pcg64-argsort-v1"
+N_DIRS = len(DIR_VECTORS)
+DIR_INDEX = {vec: i for i, vec in enumerate(DIR_VECTORS.values())}
+VECTORS = np.array(list(DIR_VECTORS.values()), dtype=np.float64)
+
+
+def random_path(seed, cycle_count):
+    # 全サイクル分の一様乱数を1回で引き、行ごとの argsort で各サイクルの並べ替えを作る (一様乱数の順位は一様な順列になる)。
+    # NumPy が版をまたいで同じ出力を保証するのはビット生成器 (PCG64) の生の 64bit 列だけで、Generator.random() などは
+    # 保証しないので、一様乱数は生の列から自分で作る (上位 53bit → [0, 1)。今の Generator.random() と同じ値)
+    raw = np.random.PCG64(seed).random_raw(cycle_count * N_DIRS).reshape(cycle_count, N_DIRS)
+    keys = (raw >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+    return np.argsort(keys, axis=1, kind="stable").astype(np.uint8).ravel()
+
+
+def ordered_path(order, cycle_count):
+    return np.tile(np.asarray(order, dtype=np.uint8), cycle_count)
+
+
+def motion_spec(seed=None, order=None, cycle_count=20):
+    # セッションと一緒に保存する移動パスの設定 (JSON にそのまま書ける辞書)
+    if order is None:
+        return {"generator": GENERATOR, "pattern": "random", "seed": int(seed), "cycles": int(cycle_count)}
+    return {"generator": GENERATOR, "pattern": "ordered", "order": [int(i) for i in order], "cycles": int(cycle_count)}
+
+
+def path_from_spec(spec):
+    if spec.get("generator") != GENERATOR:
+        raise ValueError(f"unknown motion path generator: {spec.get('generator')!r}")
+    if spec["pattern"] == "random":
+        return random_path(spec["seed"], spec["cycles"])
+    return ordered_path(spec["order"], spec["cycles"])
+
+
+def encode_path(dirs):
+    # ブラウザへ送る形式: 添字1文字ずつの文字列 ("0"〜"7")
+    return (np.asarray(dirs, dtype=np.uint8) + ord("0")).tobytes().decode("ascii")
+
+
+def decode_path(text):
+    return np.frombuffer(text.encode("ascii"), dtype=np.uint8) - ord("0")
+
+
+def path_offsets(dirs, move_phase, move_range):
+    # ページの samplePath と同じ計算: 各ステップで 原点 → 移動先 → 原点 を線形に往復する
+    move_phase = np.asarray(move_phase, dtype=np.float64)
+    steps = len(dirs)
+    pos = move_phase * steps
+    step = np.minimum(np.floor(pos).astype(np.int64), steps - 1)
+    frac = pos - step
+    amp = np.where(frac < 0.5, frac * 2, 2 - frac * 2) * move_range
+    vec = VECTORS[np.asarray(dirs)[step]]
+    return vec[..., 0] * amp, vec[..., 1] * amp
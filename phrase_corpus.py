@@ -0,0 +1,70 @@
+import numpy as np
+
+from keyboard_layout import KEY_CODES
+
+# 入力課題 (お題) のコーパス。streamlit に依存しないので、解析側でも同じ規則で打鍵を分類できる。
+#
+#   phrases = parse_corpus("password18\nhello world")   # 1行1題
+#   payload = corpus_payload(phrases)                   # ページへ送る形式 (各お題の期待キー列を解決済み)
+#   entry = classify_key(expected, typed, code)         # ページの classifyKey と同じ1打鍵の分類
+#
+# お題の文字は rows の val (1文字のキーと Space) で打てるものに限る。期待キー列は keyboard_layout.KEY_CODES の
+# キーコードで持つので、ブラウザは打鍵ごとにキーコードを1つ比べるだけで正誤を判定できる。
+
+DEFAULT_PHRASES = ("password18",)
+
+# 打鍵の分類 (Entry 列の値)。0 は分類の導入前の記録など、分類されていない打鍵
+ENTRY_CLASSES = ("unknown", "correct", "substitution", "insertion", "correction")
+ENTRY_CODES = {name: i for i, name in enumerate(ENTRY_CLASSES)}
+CORRECT = ENTRY_CODES["correct"]
+SUBSTITUTION = ENTRY_CODES["substitution"]
+INSERTION = ENTRY_CODES["insertion"]
+CORRECTION = ENTRY_CODES["correction"]
+
+BS_CODE = KEY_CODES["BS"]
+# お題の文字 → キーの値 (空白は Space キー、それ以外は同じ1文字の val を持つキー)
+CHAR_KEYS = {" ": "Space", **{val: val for val in KEY_CODES if len(val) == 1}}
+
+
+def phrase_keys(phrase):
+    # お題を打つときに押すキーのキーコード列
+    missing = sorted({c for c in phrase if c not in CHAR_KEYS})
+    if missing:
+        raise ValueError(f"phrase {phrase!r} contains characters not on the keyboard: {''.join(missing)!r}")
+    return np.array([KEY_CODES[CHAR_KEYS[c]] for c in phrase], dtype=np.int16)
+
+
+def parse_corpus(text):
+    # 1行1題のテキストからお題の一覧を作る (前後の空白と空行は無視する)
+    phrases = tuple(line.strip() for line in text.splitlines() if line.strip())
+    if not phrases:
+        raise ValueError("phrase corpus is empty")
+    for phrase in phrases:
+        phrase_keys(phrase)
+    return phrases
+
+
+def corpus_payload(phrases):
+    # ページへ送るお題の一覧と、それぞれの期待キー列 (JSON にそのまま書ける形)
+    return {"phrases": list(phrases), "keys": [phrase_keys(p).tolist() for p in phrases]}
+
+
+def phrase_for_trial(phrases, trial):
+    # 試行番号 (1始まり) のお題。お題の数より試行が多いときは先頭から繰り返す
+    return phrases[(trial - 1) % len(phrases)]
+
+
+def classify_key(expected, typed, code):
+    # 1打鍵の分類。expected はお題の期待キー列、typed は打鍵前の入力欄の文字を打ったキーのキーコード列。
+    #   correction:   BS (直前の1文字を消す)
+    #   correct:      入力位置の期待キーと同じ
+    #   insertion:    お題の末尾を越えた打鍵、または直前に正しく打ったキーをもう一度打った (二度打ち)
+    #   substitution: それ以外 (入力位置の期待キーの代わりに別のキーを打った)
+    if code == BS_CODE:
+        return CORRECTION
+    pos = len(typed)
+    if pos < len(expected) and code == expected[pos]:
+        return CORRECT
+    if pos >= len(expected) or (pos > 0 and code == typed[-1] == expected[pos - 1]):
+        return INSERTION
+    return SUBSTITUTION
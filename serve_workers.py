@@ -0,0 +1,106 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# 1台のマシンで Streamlit を複数プロセス起動し、nginx などで1つのポートにまとめるための起動スクリプト。
+#
+#   python serve_workers.py --workers 4 --nginx keyboard_nginx.conf   # 8601〜8604 で起動し、nginx の設定を書き出す
+#   nginx -c "$PWD/keyboard_nginx.conf"                               # 8501 で受けて各ワーカーへ振り分ける
+#
+# Streamlit のセッション (session_state・WebSocket) はプロセスの中にしかないので、
+# 同じタブレットが常に同じワーカーにつながるよう、接続元 IP アドレス全体のハッシュで振り分ける。
+# (ip_hash は IPv4 の上位3オクテットしか見ないので、同じ /24 の実験室のタブレットが全て1つのワーカーに集まる)
+# 打鍵記録の保存先 (KB_DATA_DIR) は全ワーカーで共有する。1つのセッションに書き込むのは1つのワーカーだけになる。
+# 何人まで収容できるかは benchmarks/load_test.py で1プロセスの上限を測ってから決める。
+
+APP_DIR = Path(__file__).resolve().parent
+
+NGINX_TEMPLATE = """\
+worker_processes 1;
+events {{ worker_connections 1024; }}
+
+http {{
+    upstream keyboard_workers {{
+        hash $remote_addr consistent;
+{servers}
+    }}
+
+    map $http_upgrade $connection_upgrade {{
+        default upgrade;
+        ''      close;
+    }}
+
+    server {{
+        listen {listen};
+        location / {{
+            proxy_pass http://keyboard_workers;
+            proxy_http_version 1.1;
+            proxy_set_header Upgrade $http_upgrade;
+            proxy_set_header Connection $connection_upgrade;
+            proxy_set_header Host $host;
+            # 実験中は WebSocket がつながったままになるので切らない
+            proxy_read_timeout 1d;
+            proxy_send_timeout 1d;
+        }}
+    }}
+}}
+"""
+
+
+def nginx_config(ports, listen):
+    servers = "\n".join(f"        server 127.0.0.1:{port};" for port in ports)
+    return NGINX_TEMPLATE.format(servers=servers, listen=listen)
+
+
+def start_worker(app, port):
+    return subprocess.Popen([
+        sys.executable, "-m", "streamlit", "run", str(APP_DIR / app),
+        "--server.headless", "true",
+        "--server.address", "127.0.0.1",
+        "--server.port", str(port),
+        "--server.fileWatcherType", "none",
+        "--browser.gatherUsageStats", "false",
+    ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Streamlit を複数ワーカーで起動する")
+    parser.add_argument("--app", default="app.py", choices=["app.py", "app_test.py"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="ワーカー数 (既定: CPU コア数)")
+    parser.add_argument("--base-port", type=int, default=8601, help="1つ目のワーカーのポート")
+    parser.add_argument("--listen", type=int, default=8501, help="nginx で受けるポート")
+    parser.add_argument("--nginx", type=Path, help="nginx の設定ファイルの書き出し先")
+    args = parser.parse_args(argv)
+
+    ports = [args.base_port + i for i in range(args.workers)]
+    if args.nginx:
+        args.nginx.write_text(nginx_config(ports, args.listen), encoding="utf-8")
+        print(f"nginx config: {args.nginx}")
+
+    workers = [start_worker(args.app, port) for port in ports]
+    print(f"{args.app}: {len(workers)} workers on ports {ports[0]}-{ports[-1]}")
+
+    def stop(code=0):
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+        sys.exit(code)
+
+    signal.signal(signal.SIGINT, lambda *_: stop())
+    signal.signal(signal.SIGTERM, lambda *_: stop())
+    # どれか1つが落ちたら全体を止める (そのワーカーに振り分けられたタブレットがつながらなくなるため)
+    while True:
+        for port, worker in zip(ports, workers):
+            if worker.poll() is not None:
+                print(f"worker on port {port} exited with {worker.returncode}", file=sys.stderr)
+                stop(1)
+        time.sleep(1)
+
+
+if __name__ == "__main__":
+    main()
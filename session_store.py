@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+
+import numpy as np
+import streamlit as st
+
+from keystroke_schema import COLUMN_NAMES, DTYPES, records_to_columns
+
+# ブラウザから試行ごとに送られてくる打鍵記録を、セッション (参加者) ごとの列指向ストアに追記する。
+#
+#   collected_data/<セッションID>/<列名>.bin   固定 dtype (keystroke_schema.COLUMNS) の生配列
+#   collected_data/<セッションID>/meta.json    確定済みの行数と保存済みの最大 seq
+#   collected_data/<セッションID>/frames.json  試行ごとのフレーム時間の集計 (試行番号 → 集計)
+#   collected_data/<セッションID>/motion.json  試行ごとの移動パスの設定 (試行番号 → motion_path.motion_spec)
+#   collected_data/<セッションID>/phrases.json 試行ごとのお題 (試行番号 → 文字列)
+#
+# バッチには試行番号が seq として付いており、保存済みの最大 seq を受領確認 (ack) として返す。
+# ブラウザは ack を受け取ったバッチを再送しない (sessionStorage のチャンクは容量が足りなくなるまで残す)。
+
+DATA_DIR = Path(os.environ.get("KB_DATA_DIR", Path(__file__).with_name("collected_data")))
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9-]{8,64}$")
+
+logger = logging.getLogger(__name__)
+
+
+def _read_meta(session_dir):
+    path = session_dir / "meta.json"
+    if not path.exists():
+        return {"rows": 0, "seq": 0}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _write_meta(session_dir, meta):
+    # 一時ファイル経由で置き換え、途中で落ちても meta.json が壊れないようにする
+    tmp = session_dir / "meta.json.tmp"
+    tmp.write_text(json.dumps(meta), encoding="utf-8")
+    os.replace(tmp, session_dir / "meta.json")
+
+
+def _read_by_trial(session_dir, filename):
+    path = Path(session_dir) / filename
+    if not path.exists():
+        return {}
+    return {int(trial): value for trial, value in json.loads(path.read_text(encoding="utf-8")).items()}
+
+
+def _write_by_trial(session_dir, filename, values):
+    tmp = session_dir / f"{filename}.tmp"
+    tmp.write_text(json.dumps({str(trial): value for trial, value in sorted(values.items())}), encoding="utf-8")
+    os.replace(tmp, session_dir / filename)
+
+
+def read_frames(session_dir):
+    # 試行番号 (int) → フレーム時間の集計 {frames, dropped, sumMs, maxMs, refreshMs, hist}
+    return _read_by_trial(session_dir, "frames.json")
+
+
+def read_motion(session_dir):
+    # 試行番号 (int) → 移動パスの設定。motion_path.path_from_spec() で実験中と同じパスを再生成できる
+    return _read_by_trial(session_dir, "motion.json")
+
+
+def read_phrases(session_dir):
+    # 試行番号 (int) → その試行のお題。phrase_corpus.phrase_keys() で期待キー列に戻せる
+    return _read_by_trial(session_dir, "phrases.json")
+
+
+def read_session(session_dir):
+    # 列名 → np.memmap (コピーせずにファイルを直接参照する)。確定済みの行だけを返す。
+    # 時間の整数列の欠損は keystroke_schema.MISSING_TIME (time_values() で NaN にできる)。
+    session_dir = Path(session_dir)
+    rows = _read_meta(session_dir)["rows"]
+    columns = {}
+    for name in COLUMN_NAMES:
+        if rows == 0:
+            columns[name] = np.empty(0, dtype=DTYPES[name])
+        else:
+            columns[name] = np.memmap(session_dir / f"{name}.bin", dtype=DTYPES[name], mode="r", shape=(rows,))
+    return columns
+
+
+def _trial_records(session, batch):
+    # バッチ (seq = 試行番号) のうち、その試行の行だけ。他の試行の行は二重に保存しないよう捨てる
+    seq = int(batch["seq"])
+    records = [r for r in batch["records"] if int(r.get("trial") or 0) == seq]
+    if len(records) < len(batch["records"]):
+        logger.warning("session %s batch %d: dropped %d rows of other trials", session, seq, len(batch["records"]) - len(records))
+    return records
+
+
+class SessionStore:
+    def __init__(self, data_dir):
+        self.data_dir = Path(data_dir)
+        self._lock = threading.Lock()
+
+    def session_dir(self, session):
+        return self.data_dir / session
+
+    def append(self, payload):
+        # 未保存のバッチだけをまとめて列ファイルに追記し、ack ({"session", "seq"}) を返す
+        if not payload or not SESSION_ID_PATTERN.match(str(payload.get("session", ""))):
+            return None
+        session = payload["session"]
+        session_dir = self.session_dir(session)
+        with self._lock:
+            meta = _read_meta(session_dir)
+            batches = sorted(
+                (b for b in payload.get("batches", []) if int(b["seq"]) > meta["seq"]),
+                key=lambda b: int(b["seq"]),
+            )
+            if batches:
+                records = [r for b in batches for r in _trial_records(session, b)]
+                columns = records_to_columns(records)
+                session_dir.mkdir(parents=True, exist_ok=True)
+                for name in COLUMN_NAMES:
+                    with open(session_dir / f"{name}.bin", "ab") as f:
+                        # 前回の書き込みが途中で止まっていた場合は確定済みの行まで切り詰める
+                        f.truncate(meta["rows"] * DTYPES[name].itemsize)
+                        f.write(columns[name].tobytes())
+                # フレーム時間・移動パス・お題は試行番号で上書きするので、meta.json より先に書いても重複しない
+                for filename, field in (("frames.json", "frames"), ("motion.json", "motion"), ("phrases.json", "phrase")):
+                    values = {int(b["seq"]): b[field] for b in batches if b.get(field)}
+                    if values:
+                        _write_by_trial(session_dir, filename, {**_read_by_trial(session_dir, filename), **values})
+                meta = {"rows": meta["rows"] + len(records), "seq": int(batches[-1]["seq"])}
+                _write_meta(session_dir, meta)
+        return {"session": session, "seq": meta["seq"]}
+
+    def read(self, session):
+        return read_session(self.session_dir(session))
+
+    def read_frames(self, session):
+        return read_frames(self.session_dir(session))
+
+    def read_motion(self, session):
+        return read_motion(self.session_dir(session))
+
+    def read_phrases(self, session):
+        return read_phrases(self.session_dir(session))
+
+
+@st.cache_resource(show_spinner=False)
+def get_session_store():
+    # プロセス内の全セッションで共有する
+    return SessionStore(DATA_DIR)
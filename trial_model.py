@@ -0,0 +1,284 @@
+import csv
+
+import numpy as np
+import pandas as pd
+
+from keyboard_layout import KEY_VALUES, ROWS
+from keystroke_schema import COLUMNS, COLUMN_NAMES, CSV_HEADERS, DTYPES, key_code
+from motion_path import path_offsets, random_path
+from phrase_corpus import CHAR_KEYS, DEFAULT_PHRASES, classify_key, phrase_for_trial, phrase_keys
+
+# ブラウザ (keyboard_page.html) の試行の進め方を Python で再現した参照モデルと、
+# それを使って書き出しスキーマ (keystroke_schema.COLUMNS) どおりの合成セッションを作る生成器。
+# 参加者を集めずに、解析・取り込みのベンチマークや負荷試験を行うために使う。
+#
+#   columns = generate_session(seed=1, n_trials=100, scale_min=0.8, scale_max=1.1, move_range=30)
+#   write_csv(columns, "synthetic/keyboard_data.csv")
+
+# お題を最後まで入力してから次の試行へ進むまでの待ち時間 (ms)
+AUTO_ADVANCE_MS = 200
+
+
+def apply_key(text, val):
+    # 1打鍵で入力欄の文字列がどう変わるか (BS は1文字削除、1文字のキーはそのまま、Space は空白、それ以外は ■)
+    if val == "BS":
+        return text[:-1]
+    if len(val) == 1:
+        return text + val
+    if val == "Space":
+        return text + " "
+    return text + "■"
+
+
+class TrialState:
+    # 試行の状態遷移 (ブラウザの onKeyDown / onKeyUp / nextTrial / finishAllTrials と同じ規則)
+    def __init__(self, max_trials, phrases=DEFAULT_PHRASES):
+        self.max_trials = max_trials
+        self.phrases = phrases
+        self.trial = 1
+        self.finished = False
+        self._start_trial()
+
+    def _start_trial(self):
+        self.target = phrase_for_trial(self.phrases, self.trial)
+        self.expected = phrase_keys(self.target)
+        self.text = ""
+        self.typed = [] # 入力欄の各文字を打ったキーのキーコード
+
+    def can_press(self):
+        # pointerdown の上限チェック (お題の文字数に達した後は次の試行に進むまで押下を受け付けない)
+        return not self.finished and len(self.text) < len(self.target)
+
+    def release(self, val):
+        # pointerup。記録された場合は打鍵の分類 (phrase_corpus.ENTRY_CLASSES の添字)、されなければ None を返す。
+        # お題の文字数に達したら自動で次の試行へ進む
+        if not self.can_press():
+            return None
+        code = key_code(val)
+        entry = classify_key(self.expected, self.typed, code)
+        self.text = apply_key(self.text, val)
+        if val == "BS":
+            del self.typed[-1:]
+        else:
+            self.typed.append(code)
+        if len(self.text) >= len(self.target):
+            self.next_trial()
+        return entry
+
+    def next_trial(self):
+        if self.trial < self.max_trials:
+            self.trial += 1
+            self._start_trial()
+        else:
+            self.finished = True
+
+
+# --- 合成セッションの生成 ---
+
+# 同じ行の隣のキー (打ち間違いの候補。1文字のキーのみ)
+_NEIGHBOURS = {}
+for _row in ROWS:
+    _vals = [k["val"] for k in _row]
+    for _i, _val in enumerate(_vals):
+        _NEIGHBOURS[_val] = [v for v in _vals[max(_i - 1, 0):_i + 2] if v != _val and len(v) == 1]
+
+# キーの幅 (rows の w を1行の合計で割った比)
+KEY_WIDTH_RATIOS = np.array([k["w"] / sum(x["w"] for x in row) for row in ROWS for k in row])
+
+# 打鍵時間の基準値 (ms、対数正規分布の中央値と σ)
+HOLD_MEDIAN, HOLD_SIGMA = 95.0, 0.25
+FLIGHT_MEDIAN, FLIGHT_SIGMA = 230.0, 0.35
+REACTION_MEDIAN, REACTION_SIGMA = 650.0, 0.3
+CORRECTION_MS = 250.0
+ERROR_RATE = 0.03
+CORRECTION_RATE = 0.8
+# 縮小 (1 - scale) と移動量 (px / 100) による遅れの係数
+SCALE_SLOWDOWN = 0.8
+MOVE_SLOWDOWN = 0.5
+
+# 画面上のキーボードの大きさと中心 (px)
+KB_WIDTH, KB_HEIGHT = 1000.0, 400.0
+KB_CENTER = (520.0, 330.0)
+CLOCK_ANCHOR = 1.7e12
+
+# ブラウザが toFixed で丸めて記録する列の小数桁数
+BROWSER_DECIMALS = {
+    "scale": 3, "kb_x": 1, "kb_y": 1, "pressure": 3, "finger_area": 2, "scale_phase": 4, "move_phase": 5,
+    "touch_dx": 2, "touch_dy": 2, "touch_nx": 4, "touch_ny": 4,
+}
+
+
+def type_session(rng, n_trials, error_rate=ERROR_RATE, correction_rate=CORRECTION_RATE, phrases=DEFAULT_PHRASES):
+    # TrialState に従って、打ち間違い (隣のキー) と BS による訂正を含む打鍵列を作る。
+    # 戻り値: (試行番号, キーコード, 訂正の BS か, 打鍵の分類) の配列
+    state = TrialState(n_trials, phrases)
+    trials, keys, corrections, entries = [], [], [], []
+    batch = n_trials * max(len(p) for p in phrases)
+    draws = iter(rng.random(batch * 4).tolist())
+    pending_error = False
+    while not state.finished:
+        expected = CHAR_KEYS[state.target[len(state.text)]]
+        draw = next(draws, None)
+        if draw is None:
+            draws = iter(rng.random(batch).tolist())
+            draw = next(draws)
+        correction = pending_error and draw < correction_rate
+        if correction:
+            val = "BS"
+        elif draw > 1 - error_rate and _NEIGHBOURS.get(expected):
+            options = _NEIGHBOURS[expected]
+            val = options[min(int((draw - 1 + error_rate) / error_rate * len(options)), len(options) - 1)]
+        else:
+            val = expected
+        pending_error = not correction and val != expected
+        trials.append(state.trial)
+        keys.append(key_code(val))
+        corrections.append(correction)
+        entries.append(state.release(val))
+    return (np.array(trials, dtype=np.int32), np.array(keys, dtype=np.int16), np.array(corrections),
+            np.array(entries, dtype=np.int16))
+
+
+def _ease_in_out(x):
+    # CSS の ease-in-out に近い3次式
+    return x * x * (3 - 2 * x)
+
+
+def _round_hr(ms):
+    return np.round(ms, 3)
+
+
+def generate_session(seed=0, n_trials=100, scale_enabled=True, scale_min=0.8, scale_max=1.1, breath_ms=2000.0,
+                     move_enabled=True, move_range=30, step_ms=1000.0, touch=True, phrases=DEFAULT_PHRASES):
+    # 合成セッションを1つ作り、列名 → 配列 (keystroke_schema.DTYPES) の辞書で返す。
+    # 打鍵時間は打鍵した瞬間の拡大率と移動量に応じて遅くなる (SCALE_SLOWDOWN / MOVE_SLOWDOWN)。
+    rng = np.random.default_rng(seed)
+    mean_scale = (scale_min + scale_max) / 2 if scale_enabled else scale_min
+    difficulty = max(0.0, 1 - mean_scale) + (move_range / 100 if move_enabled else 0.0)
+    trial, key, correction, entry = type_session(rng, n_trials, error_rate=ERROR_RATE * (1 + 2 * difficulty), phrases=phrases)
+    n = len(trial)
+
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = trial[1:] != trial[:-1]
+    hold = HOLD_MEDIAN * np.exp(HOLD_SIGMA * rng.standard_normal(n))
+    flight = np.where(
+        starts,
+        REACTION_MEDIAN * np.exp(REACTION_SIGMA * rng.standard_normal(n)),
+        FLIGHT_MEDIAN * np.exp(FLIGHT_SIGMA * rng.standard_normal(n)) + CORRECTION_MS * correction,
+    )
+
+    # アニメーションの方向列 (ページのランダムモードと同じ生成器。同じシードなら同じパス)
+    dirs = random_path(seed, 20)
+
+    def motion_at(t):
+        if scale_enabled:
+            scale_phase = (t / breath_ms) % 1.0
+            scale = scale_min + (scale_max - scale_min) * _ease_in_out(1 - np.abs(1 - 2 * scale_phase))
+        else:
+            scale_phase = np.zeros_like(t)
+            scale = np.full_like(t, scale_min)
+        if move_enabled:
+            move_phase = (t / (step_ms * len(dirs))) % 1.0
+            offset = np.column_stack(path_offsets(dirs, move_phase, move_range))
+        else:
+            move_phase = np.zeros_like(t)
+            offset = np.zeros((len(t), 2))
+        return scale, scale_phase, move_phase, offset
+
+    def timeline(flight, hold):
+        # 試行ごとの開始時刻 (前の試行の最後の離鍵 + AUTO_ADVANCE_MS) と各打鍵の押下・離鍵時刻
+        trial_index = np.cumsum(starts) - 1
+        rel_down = np.cumsum(flight)
+        trial_offset = rel_down[starts] - flight[starts]
+        rel_down = rel_down - trial_offset[trial_index]
+        rel_up = rel_down + hold
+        ends = np.zeros(len(trial_offset))
+        np.maximum.at(ends, trial_index, rel_up)
+        t0 = np.concatenate([[1000.0], 1000.0 + np.cumsum(ends[:-1] + AUTO_ADVANCE_MS)])
+        return t0[trial_index], t0[trial_index] + rel_down, t0[trial_index] + rel_up
+
+    # 拡大率・移動量は押下時刻で決まるので、基準の時刻で1回見積もってから打鍵時間を伸ばす
+    _, down, _ = timeline(flight, hold)
+    scale, _, _, offset = motion_at(down)
+    slowdown = 1 + SCALE_SLOWDOWN * np.maximum(0, 1 - scale) + MOVE_SLOWDOWN * np.hypot(*offset.T) / 100
+    flight = flight * slowdown
+    hold = hold * (1 + (slowdown - 1) / 2)
+    start, down, up = timeline(flight, hold)
+    scale, scale_phase, move_phase, offset = motion_at(down)
+
+    prev_down = np.where(starts, start, np.roll(down, 1))
+    prev_up = np.where(starts, start, np.roll(up, 1))
+    wall = lambda t: CLOCK_ANCHOR + t
+    down_wall = np.round(wall(down))
+    up_wall = np.round(wall(up))
+    up_down_hr = _round_hr(down - prev_up)
+
+    key_width = KB_WIDTH * KEY_WIDTH_RATIOS[key]
+    key_height = KB_HEIGHT * 0.18
+    spread = 0.15 * slowdown
+    touch_nx = rng.normal(0, spread)
+    touch_ny = rng.normal(0, spread)
+    refresh = 1000 / 60
+    handler_down = rng.exponential(1.0, n)
+    handler_up = rng.exponential(1.0, n)
+
+    columns = {
+        "trial": trial,
+        "key": key,
+        "time_from_start": down_wall - np.round(wall(start)),
+        "down_time": down_wall,
+        "up_time": up_wall,
+        "hold_time": up_wall - down_wall,
+        "down_down": down_wall - np.round(wall(prev_down)),
+        "up_down": down_wall - np.round(wall(prev_up)),
+        "scale": scale,
+        "kb_x": KB_CENTER[0] + offset[:, 0] - KB_WIDTH * scale / 2,
+        "kb_y": KB_CENTER[1] + offset[:, 1] - KB_HEIGHT * scale / 2,
+        "pressure": np.clip(rng.normal(0.5, 0.1, n), 0.05, 1) if touch else np.zeros(n),
+        "finger_area": rng.lognormal(np.log(400), 0.2, n) if touch else np.ones(n),
+        "scale_phase": scale_phase,
+        "move_phase": move_phase,
+        "time_from_start_hr": _round_hr(down - start),
+        "down_time_hr": _round_hr(wall(down)),
+        "up_time_hr": _round_hr(wall(up)),
+        "hold_time_hr": _round_hr(_round_hr(wall(up)) - _round_hr(wall(down))),
+        "down_down_hr": _round_hr(down - prev_down),
+        "up_down_hr": up_down_hr,
+        "overlap": up_down_hr < 0,
+        "rollover": up_down_hr < 0,
+        "down_handler_lag": _round_hr(handler_down),
+        "down_paint_lag": _round_hr(handler_down + refresh * (1 + rng.random(n))),
+        "up_handler_lag": _round_hr(handler_up),
+        "up_paint_lag": _round_hr(handler_up + refresh * (1 + rng.random(n))),
+        "touch_dx": touch_nx * key_width,
+        "touch_dy": touch_ny * key_height,
+        "touch_nx": touch_nx,
+        "touch_ny": touch_ny,
+        "entry": entry,
+    }
+    for name, decimals in BROWSER_DECIMALS.items():
+        columns[name] = np.round(columns[name], decimals)
+    return {name: np.asarray(columns[name]).astype(DTYPES[name]) for name in COLUMN_NAMES}
+
+
+def to_records(columns, start=0, stop=None):
+    # 列の辞書をブラウザが送る形式の記録 (フィールド名 → 値の dict) のリストにする (取り込みの負荷試験用)
+    fields = [(name, field) for name, field, _, _ in COLUMNS]
+    keys = np.array(KEY_VALUES + [""], dtype=object)
+    sliced = {name: columns[name][start:stop] for name, _ in fields}
+    sliced["key"] = keys[sliced["key"]]
+    values = [sliced[name].tolist() for name, _ in fields]
+    return [dict(zip((field for _, field in fields), row)) for row in zip(*values)]
+
+
+def _shortest(values):
+    # float32 の列は最短表記 (0.955 など) の float64 にしてから書き出す
+    return values.astype(str).astype(np.float64) if values.dtype == np.float32 else values
+
+
+def write_csv(columns, path):
+    # ブラウザの CSV と同じヘッダ・列順で書き出す (Key は引用符付き)
+    keys = np.array(KEY_VALUES + [""], dtype=object)
+    df = pd.DataFrame({header: _shortest(columns[name]) for name, header in zip(COLUMN_NAMES, CSV_HEADERS)})
+    df["Key"] = keys[columns["key"]]
+    df.to_csv(path, index=False, quoting=csv.QUOTE_NONNUMERIC)